@@ -0,0 +1,155 @@
+"""Fixtures for Tion integration benchmarks"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from homeassistant.const import (
+    CONF_USERNAME,
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_FILE_PATH,
+    EVENT_STATE_CHANGED,
+)
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.tion import api
+from custom_components.tion.const import DOMAIN
+
+from .simulator import TionCloudSimulator
+
+LOOP_PROBE_INTERVAL = 0.001
+
+_RESULTS = []
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(request):
+    if "recorder_mock" in request.fixturenames:
+        request.getfixturevalue("recorder_db_url")  # the database is prepared before hass is created
+    request.getfixturevalue("enable_custom_integrations")
+    yield
+
+
+@pytest.fixture
+async def tion_cloud(socket_enabled, monkeypatch):
+    """Return factory starting simulator and pointing the integration to it."""
+    runners = []
+
+    async def _start(**kwargs) -> TionCloudSimulator:
+        simulator = TionCloudSimulator(**kwargs)
+        runner = web.AppRunner(simulator.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        port = runner.addresses[0][1]
+        monkeypatch.setattr(api, "API_URL", f"http://127.0.0.1:{port}")
+        return simulator
+
+    yield _start
+
+    for runner in runners:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def tion_entry(hass: HomeAssistant, tmp_path) -> MockConfigEntry:
+    """Return config entry of the integration added to hass."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            "user_input": {
+                CONF_USERNAME: "user@example.com",
+                CONF_PASSWORD: "password",
+                CONF_SCAN_INTERVAL: 60,
+                CONF_FILE_PATH: "tion_auth-benchmark",
+            },
+        },
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+class Measurement:
+    """Cloud requests, wall time, executor time, event loop blocking and state writes of a code block."""
+
+    def __init__(self):
+        self.requests = 0
+        self.wall = 0.0
+        self.executor_jobs = 0
+        self.executor_time = 0.0
+        self.loop_block_max = 0.0
+        self.loop_block_total = 0.0
+        self.state_writes = 0
+
+
+@asynccontextmanager
+async def measure(hass: HomeAssistant, simulator: TionCloudSimulator):
+    """Measure code block running on hass against the simulator."""
+    result = Measurement()
+    original_executor_job = hass.async_add_executor_job
+
+    def _timed(target, *args):
+        start = time.perf_counter()
+        try:
+            return target(*args)
+        finally:
+            result.executor_time += time.perf_counter() - start
+
+    def _async_add_executor_job(target, *args):
+        result.executor_jobs += 1
+        return original_executor_job(_timed, target, *args)
+
+    async def _probe_loop():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_PROBE_INTERVAL)
+            lag = time.perf_counter() - start - LOOP_PROBE_INTERVAL
+            if lag > 0:
+                result.loop_block_max = max(result.loop_block_max, lag)
+                result.loop_block_total += lag
+
+    def _count_state_write(event):
+        result.state_writes += 1
+
+    hass.async_add_executor_job = _async_add_executor_job
+    unsub = hass.bus.async_listen(EVENT_STATE_CHANGED, _count_state_write)
+    probe = asyncio.create_task(_probe_loop())
+    requests_before = simulator.total
+    start = time.perf_counter()
+    try:
+        yield result
+        await hass.async_block_till_done()
+    finally:
+        result.wall = time.perf_counter() - start
+        result.requests = simulator.total - requests_before
+        probe.cancel()
+        unsub()
+        hass.async_add_executor_job = original_executor_job
+
+
+@pytest.fixture
+def benchmark_report(request):
+    """Return callback recording measurement for the summary table."""
+
+    def _record(name: str, result: Measurement, cycles: int = 1):
+        _RESULTS.append((request.node.name, name, cycles, result))
+
+    return _record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _RESULTS:
+        return
+    terminalreporter.section("Tion benchmarks")
+    terminalreporter.write_line(
+        f"{'test':<50} {'step':<14} {'req/cycle':>9} {'wall ms':>9} {'exec jobs':>9} {'exec ms':>8} "
+        f"{'block max ms':>12} {'writes':>7}")
+    for test, name, cycles, result in _RESULTS:
+        terminalreporter.write_line(
+            f"{test:<50} {name:<14} {result.requests / cycles:>9.1f} {result.wall * 1000 / cycles:>9.1f} "
+            f"{result.executor_jobs:>9} {result.executor_time * 1000:>8.1f} "
+            f"{result.loop_block_max * 1000:>12.1f} {result.state_writes:>7}")
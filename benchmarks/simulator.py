@@ -0,0 +1,240 @@
+"""Local stand-in for Tion MagicAir cloud API
+
+Serves the endpoints used by the integration with a configurable number of zones and devices,
+artificial latency, error injection and sensor noise. Every request is counted per endpoint.
+Several accounts are served when `accounts` > 1, every username logs in to the next one.
+
+Run standalone for manual experiments with the client:
+
+    python -m benchmarks.simulator --port 8080 --zones 4 --breezers 2 --magicairs 1
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from collections import Counter
+
+from aiohttp import web
+
+TOKEN = "simulated-token"
+
+
+class TionCloudSimulator:
+    """In-memory Tion cloud with the same payload layout as api2.magicair.tion.ru."""
+
+    def __init__(self, zones: int = 1, breezers: int = 1, magicairs: int = 1, latency: float = 0.0,
+                 error_rate: float = 0.0, task_steps: int = 0, seed: int = 0, accounts: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.co2_noise = 0.0  # amplitude of random changes of MagicAir values on every poll
+        self.temperature_noise = 0.0
+        self.task_steps = task_steps
+        self.command_status = 200  # HTTP status of zone and device commands, others are refused with it
+        self.reject_commands = False  # zone and device commands are answered with an error status
+        self.requests = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0  # most requests served at the same time
+        self._random = random.Random(seed)
+        self._tasks = {}
+        self._task_ids = itertools.count(1)
+        # zones of every account, guids of accounts after the first one are prefixed with the account index
+        self.accounts = [[self._zone(z, breezers, magicairs, f"a{a}-" if a else "") for z in range(zones)]
+                         for a in range(accounts)]
+        self.zones = self.accounts[0]
+        self._logins = {}  # account index by username
+
+    @classmethod
+    def _zone(cls, index: int, breezers: int, magicairs: int, prefix: str = "") -> dict:
+        return {
+            "guid": f"{prefix}zone-{index}",
+            "name": f"Zone {index}",
+            "mode": {"current": "manual", "auto_set": {"co2": 800.0}},
+            "devices": [cls._breezer(index, b, prefix) for b in range(breezers)] +
+                       [cls._magicair(index, m, prefix) for m in range(magicairs)],
+        }
+
+    @staticmethod
+    def _breezer(zone_index: int, index: int, prefix: str = "") -> dict:
+        return {
+            "guid": f"{prefix}breezer-{zone_index}-{index}",
+            "name": f"Breezer {zone_index}-{index}",
+            "type": "breezer3",
+            "firmware": "0220",
+            "t_min": 0.0,
+            "t_max": 30.0,
+            "data": {
+                "data_valid": True,
+                "is_on": True,
+                "heater_installed": True,
+                "heater_enabled": False,
+                "heater_mode": "maintenance",
+                "speed": 2.0,
+                "speed_min_set": 0,
+                "speed_max_set": 6,
+                "speed_limit": 6.0,
+                "t_in": 5.0,
+                "t_out": 20.0,
+                "t_set": 18.0,
+                "gate": 2,
+                "filter_need_replace": False,
+            },
+        }
+
+    @staticmethod
+    def _magicair(zone_index: int, index: int, prefix: str = "") -> dict:
+        return {
+            "guid": f"{prefix}magicair-{zone_index}-{index}",
+            "name": f"MagicAir {zone_index}-{index}",
+            "type": "co2mb",
+            "data": {
+                "co2": 600.0,
+                "temperature": 22.0,
+                "humidity": 40.0,
+            },
+        }
+
+    def add_breezer(self, zone_index: int = 0) -> str:
+        """Add breezer to the zone as if it was paired in the Tion app, return its guid."""
+        devices = self.zones[zone_index]["devices"]
+        breezer = self._breezer(zone_index, len(devices))
+        devices.append(breezer)
+        return breezer["guid"]
+
+    def remove_device(self, guid: str) -> None:
+        for zone in self._all_zones():
+            zone["devices"] = [device for device in zone["devices"] if device["guid"] != guid]
+
+    @property
+    def total(self) -> int:
+        """Return number of requests served."""
+        return sum(self.requests.values())
+
+    def _all_zones(self):
+        return itertools.chain.from_iterable(self.accounts)
+
+    def reset(self) -> None:
+        """Forget request counters."""
+        self.requests.clear()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_post("/idsrv/oauth2/token", self.token)
+        app.router.add_get("/location", self.location)
+        app.router.add_post("/zone/{guid}/mode", self.zone_mode)
+        app.router.add_post("/device/{guid}/mode", self.device_mode)
+        app.router.add_get("/task/{task_id}", self.task)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        self.requests[resource.canonical if resource is not None else request.path] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return web.json_response({"error": "injected"}, status=500)
+            if request.path != "/idsrv/oauth2/token" and self._account(request) is None:
+                return web.json_response({"error": "unauthorized"}, status=401)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _token(account: int) -> str:
+        return f"{TOKEN}-{account}" if account else TOKEN
+
+    def _account(self, request: web.Request) -> int | None:
+        """Return account index of the request token."""
+        for account in range(len(self.accounts)):
+            if request.headers.get("Authorization") == f"Bearer {self._token(account)}":
+                return account
+        return None
+
+    async def token(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        if not data.get("username") or not data.get("password"):
+            return web.json_response({"error": "invalid_grant"}, status=400)
+        account = self._logins.setdefault(data["username"], len(self._logins) % len(self.accounts))
+        return web.json_response({"token_type": "Bearer", "access_token": self._token(account), "expires_in": 86400})
+
+    def _add_noise(self) -> None:
+        for zone in self._all_zones():
+            for device in zone["devices"]:
+                if device["type"] == "co2mb":
+                    data = device["data"]
+                    data["co2"] = round(600.0 + self._random.uniform(-self.co2_noise, self.co2_noise))
+                    data["temperature"] = round(22.0 + self._random.uniform(-self.temperature_noise,
+                                                                            self.temperature_noise), 1)
+
+    async def location(self, request: web.Request) -> web.Response:
+        if self.co2_noise or self.temperature_noise:
+            self._add_noise()
+        zones = self.accounts[self._account(request)]
+        return web.json_response([{"guid": "location-0", "name": "Simulated", "zones": zones}])
+
+    def _queue_task(self) -> web.Response:
+        task_id = str(next(self._task_ids))
+        self._tasks[task_id] = self.task_steps
+        return web.json_response({"status": "queued", "task_id": task_id})
+
+    async def zone_mode(self, request: web.Request) -> web.Response:
+        if self.command_status != 200:
+            return web.json_response({"error": "refused"}, status=self.command_status)
+        if self.reject_commands:
+            return web.json_response({"status": "error", "description": "command is rejected"})
+        js = await request.json()
+        for zone in self._all_zones():
+            if zone["guid"] == request.match_info["guid"]:
+                zone["mode"]["current"] = js["mode"]
+                zone["mode"]["auto_set"]["co2"] = js["co2"]
+                return self._queue_task()
+        return web.json_response({"status": "error", "description": "zone not found"})
+
+    async def device_mode(self, request: web.Request) -> web.Response:
+        if self.command_status != 200:
+            return web.json_response({"error": "refused"}, status=self.command_status)
+        if self.reject_commands:
+            return web.json_response({"status": "error", "description": "command is rejected"})
+        js = await request.json()
+        for zone in self._all_zones():
+            for device in zone["devices"]:
+                if device["guid"] == request.match_info["guid"]:
+                    data = device["data"]
+                    for field in ("is_on", "heater_enabled", "heater_mode", "t_set", "speed", "speed_min_set",
+                                  "speed_max_set", "gate"):
+                        if field in js:
+                            data[field] = js[field]
+                    return self._queue_task()
+        return web.json_response({"status": "error", "description": "device not found"})
+
+    async def task(self, request: web.Request) -> web.Response:
+        task_id = request.match_info["task_id"]
+        if task_id not in self._tasks:
+            return web.json_response({"error": "not found"}, status=404)
+        if self._tasks[task_id] > 0:
+            self._tasks[task_id] -= 1
+            return web.json_response({"status": "processing"})
+        return web.json_response({"status": "completed"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--breezers", type=int, default=1, help="breezers per zone")
+    parser.add_argument("--magicairs", type=int, default=1, help="MagicAirs per zone")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--accounts", type=int, default=1)
+    args = parser.parse_args()
+    simulator = TionCloudSimulator(args.zones, args.breezers, args.magicairs, args.latency, args.error_rate,
+                                   accounts=args.accounts)
+    web.run_app(simulator.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,689 @@
+"""Setup, poll cycle and command benchmarks against the local Tion cloud simulator
+
+Run with `pytest benchmarks -q`; the summary table is printed at the end of the session.
+"""
+import asyncio
+import itertools
+import time
+from datetime import timedelta
+
+import pytest
+from homeassistant.components.climate import DOMAIN as CLIMATE_DOMAIN
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.const import CONF_USERNAME, CONF_FILE_PATH, CONF_SCAN_INTERVAL
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.helpers import device_registry as dr, entity_registry as er
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry, async_fire_time_changed
+from pytest_homeassistant_custom_component.components.recorder.common import async_wait_recording_done
+
+from custom_components.tion import async_remove_config_entry_device
+from custom_components.tion.api import TionApiError
+from custom_components.tion.const import (
+    DOMAIN,
+    TION_API,
+    TION_SCHEDULER,
+    BREAKER_THRESHOLD,
+    MAX_GLOBAL_CALLS,
+    CONF_LOCAL_CO2_CONTROL,
+    CONF_STATISTICS_ONLY,
+)
+from custom_components.tion.rolling import TionRollingWindow
+from custom_components.tion.scheduler import TionGlobalScheduler
+
+from .conftest import measure
+
+POLL_CYCLES = 10
+
+SITES = {
+    "single": {"zones": 1, "breezers": 1, "magicairs": 1},
+    "office": {"zones": 4, "breezers": 2, "magicairs": 1},
+    "open_plan": {"zones": 1, "breezers": 4, "magicairs": 1},
+}
+
+
+async def _setup(hass: HomeAssistant, entry) -> None:
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.LOADED
+
+
+async def _unload(hass: HomeAssistant, entry) -> None:
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_setup(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+
+    async with measure(hass, simulator) as result:
+        await _setup(hass, tion_entry)
+    benchmark_report(f"setup", result)
+
+    assert hass.states.async_entity_ids("sensor")
+    assert hass.states.async_entity_ids(CLIMATE_DOMAIN)
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_setup_from_cache(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    await _unload(hass, tion_entry)
+    simulator.latency = 0.5
+
+    async with measure(hass, simulator) as result:
+        await _setup(hass, tion_entry)
+    benchmark_report("setup cached", result)
+
+    assert result.wall < simulator.latency
+    entity_ids = hass.states.async_entity_ids(CLIMATE_DOMAIN)
+    assert entity_ids
+    assert all(hass.states.get(entity_id).state == "unavailable" for entity_id in entity_ids)
+
+    await hass.data[TION_API][tion_entry.entry_id].async_refresh()
+    await hass.async_block_till_done()
+    assert all(hass.states.get(entity_id).state != "unavailable" for entity_id in entity_ids)
+    await _unload(hass, tion_entry)
+
+
+async def test_setup_from_cache_cloud_outage(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"])
+    await _setup(hass, tion_entry)
+    await _unload(hass, tion_entry)
+    simulator.error_rate = 1
+
+    await _setup(hass, tion_entry)
+    await hass.data[TION_API][tion_entry.entry_id].async_refresh()
+    await hass.async_block_till_done()
+
+    for entity_id in hass.states.async_entity_ids(CLIMATE_DOMAIN):
+        assert hass.states.get(entity_id).state == "unavailable"
+    await _unload(hass, tion_entry)
+
+
+async def test_device_discovery(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    device_registry = dr.async_get(hass)
+    entity_registry = er.async_get(hass)
+    guid = simulator.add_breezer()
+
+    async with measure(hass, simulator) as result:
+        await coordinator.async_refresh()
+    benchmark_report("new device", result)
+
+    assert result.requests == 1
+    device = device_registry.async_get_device(identifiers={(DOMAIN, guid)})
+    assert device is not None
+    entity_id = entity_registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, guid)
+    assert hass.states.get(entity_id).state != "unavailable"
+    assert not await async_remove_config_entry_device(hass, tion_entry, device)
+
+    simulator.remove_device(guid)
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).state == "unavailable"
+    assert await async_remove_config_entry_device(hass, tion_entry, device)
+    device_registry.async_update_device(device.id, remove_config_entry_id=tion_entry.entry_id)
+    await hass.async_block_till_done()
+    assert entity_registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, guid) is None
+
+    # the removed device comes back without reloading the entry
+    assert simulator.add_breezer() == guid
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert device_registry.async_get_device(identifiers={(DOMAIN, guid)}) is not None
+    entity_id = entity_registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, guid)
+    assert hass.states.get(entity_id).state != "unavailable"
+    assert entity_registry.async_get_entity_id("sensor", DOMAIN, f"{guid}speed") is not None
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_poll_cycle(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll", result, POLL_CYCLES)
+
+    assert coordinator.last_update_success
+    await _unload(hass, tion_entry)
+
+
+
+async def test_long_scan_interval(hass: HomeAssistant, tion_cloud, tion_entry):
+    await tion_cloud(**SITES["single"])
+    user_input = {**tion_entry.data["user_input"], CONF_SCAN_INTERVAL: 600}
+    hass.config_entries.async_update_entry(tion_entry, data={"user_input": user_input})
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    await coordinator.async_refresh()
+    # options bounds by default include the configured interval, so polls are not more frequent
+    assert coordinator.update_interval.total_seconds() > 500
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_poll_cycle_sensor_noise(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    simulator.co2_noise = 5
+    simulator.temperature_noise = 0.2
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll noisy", result, POLL_CYCLES)
+
+    assert result.state_writes == 0
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_poll_cycle_slow_unreliable_cloud(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    simulator.latency = 0.05
+    simulator.error_rate = 0.3
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll degraded", result, POLL_CYCLES)
+
+    simulator.error_rate = 0
+    await coordinator.async_refresh()
+    assert coordinator.last_update_success
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_poll_cycle_cloud_outage(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    simulator.error_rate = 1
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll outage", result, POLL_CYCLES)
+
+    assert result.requests == BREAKER_THRESHOLD
+    assert coordinator.client.breaker.state == "open"
+    for entity_id in hass.states.async_entity_ids(CLIMATE_DOMAIN):
+        state = hass.states.get(entity_id)
+        assert state.state != "unavailable"
+        assert state.attributes["stale"] is True
+    await _unload(hass, tion_entry)
+
+
+@pytest.mark.parametrize("site", SITES)
+async def test_command_burst(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report, site):
+    simulator = await tion_cloud(**SITES[site])
+    await _setup(hass, tion_entry)
+    entity_ids = hass.states.async_entity_ids(CLIMATE_DOMAIN)
+
+    async def _call(service, **data):
+        await hass.services.async_call(CLIMATE_DOMAIN, service, data, blocking=True)
+
+    async with measure(hass, simulator) as result:
+        await asyncio.gather(*[
+            call
+            for entity_id in entity_ids
+            for call in (
+                _call("set_fan_mode", entity_id=entity_id, fan_mode="4"),
+                _call("set_hvac_mode", entity_id=entity_id, hvac_mode="heat"),
+                _call("set_temperature", entity_id=entity_id, temperature=21),
+            )
+        ])
+    benchmark_report("command burst", result)
+
+    for entity_id in entity_ids:
+        state = hass.states.get(entity_id)
+        assert state.state == "heat"
+        assert state.attributes["fan_mode"] == "4"
+        assert state.attributes["temperature"] == 21
+    await _unload(hass, tion_entry)
+
+
+async def test_command_to_removed_breezer(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    send = hass.async_create_task(coordinator.commands.async_set_breezer("breezer-1-0", speed=5))
+    other = hass.async_create_task(coordinator.commands.async_set_breezer("breezer-0-0", speed=5))
+    await asyncio.sleep(0)
+    simulator.remove_device("breezer-1-0")
+    await coordinator.async_refresh()  # polled before the queued change is sent
+
+    with pytest.raises(TionApiError):
+        await asyncio.wait_for(send, 10)
+    assert await asyncio.wait_for(other, 10) is True
+    assert simulator.zones[0]["devices"][0]["data"]["speed"] == 5
+    await _unload(hass, tion_entry)
+
+
+async def test_profile_to_removed_breezer(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    entity_registry = er.async_get(hass)
+    removed = entity_registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, "breezer-1-0")
+    kept = entity_registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, "breezer-1-1")
+    call = hass.async_create_task(hass.services.async_call(
+        DOMAIN, "apply_profile", {"zones": [simulator.zones[1]["name"]], "mode": "manual", "speed": 3},
+        blocking=True, return_response=True))
+    await asyncio.sleep(0)
+    simulator.remove_device("breezer-1-0")
+    await coordinator.async_refresh()  # polled before the queued changes are sent
+
+    response = await asyncio.wait_for(call, 10)
+    assert not response["results"][removed]["success"]
+    assert response["results"][removed]["error"]
+    assert response["results"][kept]["success"]
+    await _unload(hass, tion_entry)
+
+
+async def test_token_renewal_concurrent(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"], latency=0.01)
+    await _setup(hass, tion_entry)
+    client = hass.data[TION_API][tion_entry.entry_id].client
+
+    client.expires_at = 0  # expired
+    simulator.reset()
+    await asyncio.gather(*(client.async_get_locations() for _ in range(5)))
+    assert simulator.requests["/idsrv/oauth2/token"] == 1
+
+    client.authorization = "Bearer revoked"  # rejected by the cloud before it expires
+    simulator.reset()
+    await asyncio.gather(*(client.async_get_locations() for _ in range(5)))
+    assert simulator.requests["/idsrv/oauth2/token"] == 1
+    await _unload(hass, tion_entry)
+
+
+async def test_remove_entry(hass: HomeAssistant, hass_storage, tion_cloud, tion_entry):
+    await tion_cloud(**SITES["single"])
+    await _setup(hass, tion_entry)
+    await hass.data[TION_API][tion_entry.entry_id].async_refresh()
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=30))  # delayed saves are written
+    await hass.async_block_till_done()
+    assert "tion_auth-benchmark" in hass_storage
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    coordinator.client.expires_at = 0
+    await coordinator.async_refresh()  # the renewed token is waiting to be saved
+
+    assert await hass.config_entries.async_remove(tion_entry.entry_id)
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=60))
+    await hass.async_block_till_done()
+    assert not [key for key in hass_storage if key.startswith("tion")]
+
+
+async def test_shared_zone_command(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["open_plan"])
+    await _setup(hass, tion_entry)
+    entity_ids = hass.states.async_entity_ids(CLIMATE_DOMAIN)
+    simulator.reset()
+
+    async with measure(hass, simulator) as result:
+        await hass.services.async_call(CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_ids[0], "fan_mode": "auto"},
+                                       blocking=True)
+    benchmark_report("zone command", result)
+
+    assert simulator.requests["/zone/{guid}/mode"] == 1
+    for entity_id in entity_ids:
+        assert hass.states.get(entity_id).attributes["fan_mode"] == "auto"
+    await _unload(hass, tion_entry)
+
+
+async def test_apply_profile(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    simulator.reset()
+
+    async with measure(hass, simulator) as result:
+        response = await hass.services.async_call(
+            DOMAIN, "apply_profile",
+            {"zones": [zone["name"] for zone in simulator.zones], "mode": "manual", "speed": 3, "heater": True},
+            blocking=True, return_response=True)
+    benchmark_report("apply profile", result)
+
+    assert simulator.requests["/zone/{guid}/mode"] == len(simulator.zones)
+    assert simulator.requests["/device/{guid}/mode"] == len(response["results"])
+    assert all(result["success"] for result in response["results"].values())
+    for entity_id in response["results"]:
+        state = hass.states.get(entity_id)
+        assert state.state == "heat"
+        assert state.attributes["fan_mode"] == "3"
+    await _unload(hass, tion_entry)
+
+
+async def test_offline_command_queue(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    entity_ids = hass.states.async_entity_ids(CLIMATE_DOMAIN)
+    simulator.error_rate = 1
+
+    # automations keep retrying while the uplink is down
+    for fan_mode in ("2", "3", "4"):
+        await asyncio.gather(*[
+            hass.services.async_call(CLIMATE_DOMAIN, service, data, blocking=True)
+            for entity_id in entity_ids
+            for service, data in (("set_fan_mode", {"entity_id": entity_id, "fan_mode": fan_mode}),
+                                  ("set_temperature", {"entity_id": entity_id, "temperature": 20}))
+        ])
+    assert coordinator.commands.queued == len(entity_ids)
+    for entity_id in entity_ids:
+        assert hass.states.get(entity_id).attributes["fan_mode"] == "4"
+
+    simulator.error_rate = 0
+    coordinator.client.breaker.record_success()  # the pause is over
+    simulator.reset()
+    async with measure(hass, simulator) as result:
+        await coordinator.async_refresh()
+    benchmark_report("queue replay", result)
+
+    assert simulator.requests["/device/{guid}/mode"] == len(entity_ids)
+    assert coordinator.commands.queued == 0
+    for entity_id in entity_ids:
+        state = hass.states.get(entity_id)
+        assert state.attributes["fan_mode"] == "4"
+        assert state.attributes["temperature"] == 20
+    await _unload(hass, tion_entry)
+
+
+async def test_refused_command_not_queued(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    entity_id = hass.states.async_entity_ids(CLIMATE_DOMAIN)[0]
+    simulator.command_status = 400
+    simulator.reset()
+
+    with pytest.raises(HomeAssistantError):
+        await hass.services.async_call(CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_id, "fan_mode": "5"},
+                                       blocking=True)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "2"  # rolled back
+    assert coordinator.commands.queued == 0
+
+    for _ in range(5):
+        await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert simulator.requests["/device/{guid}/mode"] == 1
+    assert coordinator.update_interval.total_seconds() > coordinator.scheduler.min_interval
+    await _unload(hass, tion_entry)
+
+
+async def test_rejected_command_rolled_back(hass: HomeAssistant, tion_cloud, tion_entry, caplog):
+    simulator = await tion_cloud(**SITES["single"], latency=0.05)
+    await _setup(hass, tion_entry)
+    entity_id = hass.states.async_entity_ids(CLIMATE_DOMAIN)[0]
+    simulator.reject_commands = True
+
+    call = hass.async_create_task(hass.services.async_call(
+        CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_id, "fan_mode": "5"}, blocking=True))
+    await asyncio.sleep(0.01)
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "5"  # shown while the command is sent
+
+    await asyncio.wait_for(call, 10)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "2"
+    assert simulator.zones[0]["devices"][0]["data"]["speed"] == 2
+    assert "state is rolled back" in caplog.text
+    await _unload(hass, tion_entry)
+
+
+async def test_offline_command_queue_restored(hass: HomeAssistant, hass_storage, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"])
+    key = f"tion.{tion_entry.entry_id}.commands"
+    hass_storage[key] = {
+        "version": 1,
+        "key": key,
+        "data": {"commands": [
+            {"kind": "breezer", "guid": "breezer-0-0",
+             "fields": {"speed": [5, time.time()], "t_set": [25, time.time() - 2 * 3600]}},
+        ]},
+    }
+
+    await _setup(hass, tion_entry)
+
+    assert simulator.requests["/device/{guid}/mode"] == 1
+    data = simulator.zones[0]["devices"][0]["data"]
+    assert data["speed"] == 5
+    assert data["t_set"] == 18.0  # expired
+    await _unload(hass, tion_entry)
+
+
+async def test_local_co2_control(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["open_plan"])
+    hass.config_entries.async_update_entry(tion_entry, options={CONF_LOCAL_CO2_CONTROL: True})
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    entity_ids = hass.states.async_entity_ids(CLIMATE_DOMAIN)
+    magicair = next(device for device in simulator.zones[0]["devices"] if device["guid"].startswith("magicair"))
+    magicair["data"]["co2"] = 1400.0  # 600ppm over the zone target
+    await coordinator.async_refresh()
+    simulator.reset()
+
+    await hass.services.async_call(CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_ids[0], "fan_mode": "auto"},
+                                   blocking=True)
+    await hass.async_block_till_done()
+
+    assert simulator.zones[0]["mode"]["current"] == "manual"
+    assert simulator.requests["/zone/{guid}/mode"] == 0
+    assert simulator.requests["/device/{guid}/mode"] == len(entity_ids)
+    for entity_id in entity_ids:
+        state = hass.states.get(entity_id)
+        assert state.attributes["fan_mode"] == "auto"
+        assert state.attributes["speed"] == 3
+
+    simulator.co2_noise = 100
+    simulator.reset()
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("control cycle", result, POLL_CYCLES)
+
+    # speed is changed at most once per CO2_CONTROL_MIN_INTERVAL
+    assert simulator.requests["/device/{guid}/mode"] == 0
+    assert coordinator.controller.commands == len(entity_ids)
+    await _unload(hass, tion_entry)
+
+
+
+async def test_local_co2_control_keeps_speed(hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"])
+    hass.config_entries.async_update_entry(tion_entry, options={CONF_LOCAL_CO2_CONTROL: True})
+    simulator.zones[0]["devices"][0]["data"]["speed"] = 1.0
+    simulator.zones[0]["devices"][1]["data"]["co2"] = 1000.0  # the controller output is the current speed
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    entity_id = hass.states.async_entity_ids(CLIMATE_DOMAIN)[0]
+    simulator.reset()
+
+    await hass.services.async_call(CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_id, "fan_mode": "auto"},
+                                   blocking=True)
+    await hass.async_block_till_done()
+    assert simulator.total == 0
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "auto"
+    await coordinator.async_refresh()
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "auto"
+
+    await hass.services.async_call(CLIMATE_DOMAIN, "set_fan_mode", {"entity_id": entity_id, "fan_mode": "1"},
+                                   blocking=True)
+    await hass.async_block_till_done()
+    assert hass.states.get(entity_id).attributes["fan_mode"] == "1"
+    await _unload(hass, tion_entry)
+
+
+def test_rolling_window():
+    window = TionRollingWindow(duration=60, capacity=4)
+    for when, value in ((0, 5.0), (10, 9.0), (20, 7.0), (30, 3.0)):
+        window.add(when, value)
+    assert (window.mean, window.max, window.rate) == (6.0, 9.0, -2 / 30 * 3600)
+
+    window.add(40, 1.0)  # polled faster than planned, the buffer grows
+    window.add(85, 2.0)  # samples older than 60sec are dropped
+    assert len(window) == 3
+    assert (window.mean, window.max) == (2.0, 3.0)
+
+    window.expire(150)  # not polled for a while
+    assert (len(window), window.mean, window.max) == (0, None, None)
+
+    for when in range(150, 211, 5):
+        window.add(when, float(when))
+    assert len(window) == 13
+    assert (window.mean, window.max, window.rate) == (180.0, 210.0, 3600.0)
+
+
+async def test_rolling_statistics(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["single"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    magicair = simulator.zones[0]["devices"][1]["data"]
+
+    async with measure(hass, simulator) as result:
+        for co2 in (700.0, 800.0, 900.0, 800.0):
+            magicair["co2"] = co2
+            await coordinator.async_refresh()
+    benchmark_report("rolling poll", result, 4)
+
+    assert hass.states.get("sensor.magicair_0_0_co2_mean_5m").state == "760.0"  # with 600 of the first poll
+    assert hass.states.get("sensor.magicair_0_0_co2_max_1h").state == "900.0"
+    assert coordinator.statistics.window("magicair-0-0", "co2", 300).rate > 0
+    await _unload(hass, tion_entry)
+
+
+async def test_statistics_only(recorder_mock, hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"])
+    hass.config_entries.async_update_entry(tion_entry, options={CONF_STATISTICS_ONLY: True})
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    simulator.co2_noise = 200
+    simulator.temperature_noise = 2
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll stats only", result, POLL_CYCLES)
+
+    assert result.state_writes == 0
+    await _unload(hass, tion_entry)
+    await async_wait_recording_done(hass)
+
+    statistic_id = "tion:magicair_0_0_co2"
+    stats = await recorder_mock.async_add_executor_job(
+        statistics_during_period, hass, dt_util.utcnow() - timedelta(hours=1), None, {statistic_id}, "hour", None,
+        {"mean", "min", "max"})
+    assert len(stats[statistic_id]) == 1
+    row = stats[statistic_id][0]
+    assert row["min"] <= row["mean"] <= row["max"]
+    assert row["max"] - row["min"] > 0
+
+
+
+async def test_statistics_only_reload(recorder_mock, hass: HomeAssistant, tion_cloud, tion_entry):
+    simulator = await tion_cloud(**SITES["single"])
+    hass.config_entries.async_update_entry(tion_entry, options={CONF_STATISTICS_ONLY: True})
+    await _setup(hass, tion_entry)
+    magicair = simulator.zones[0]["devices"][1]["data"]
+    magicair["co2"] = 2000.0
+    await hass.data[TION_API][tion_entry.entry_id].async_refresh()
+
+    # values polled before the reload are imported with the hour
+    assert await hass.config_entries.async_reload(tion_entry.entry_id)
+    await hass.async_block_till_done()
+    magicair["co2"] = 500.0
+    await hass.data[TION_API][tion_entry.entry_id].async_refresh()
+    await _unload(hass, tion_entry)
+    await async_wait_recording_done(hass)
+
+    statistic_id = "tion:magicair_0_0_co2"
+    stats = await recorder_mock.async_add_executor_job(
+        statistics_during_period, hass, dt_util.utcnow() - timedelta(hours=1), None, {statistic_id}, "hour", None,
+        {"min", "max"})
+    assert stats[statistic_id][0]["max"] == 2000.0
+    assert stats[statistic_id][0]["min"] == 500.0
+
+
+def test_global_scheduler():
+    planner = TionGlobalScheduler(MAX_GLOBAL_CALLS)
+    for _ in range(3):  # entries are planned again after their polls
+        planned = [planner.plan(f"entry{index}", 300, min_interval=30) for index in range(4)]
+        assert all(30 <= interval <= 300 for interval in planned)
+        assert min(abs(a - b) for a, b in itertools.combinations(planned, 2)) >= 300 / 4 * 0.5
+
+    assert planner.plan("entry0", 60, urgent=True) == 60  # polls after commands are not moved
+
+
+async def test_multiple_accounts(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"], accounts=MAX_GLOBAL_CALLS + 2)
+    entries = [tion_entry]
+    for index in range(1, MAX_GLOBAL_CALLS + 2):
+        user_input = {**tion_entry.data["user_input"], CONF_USERNAME: f"user{index}@example.com",
+                      CONF_FILE_PATH: f"tion_auth-benchmark-{index}"}
+        entry = MockConfigEntry(domain=DOMAIN, data={"user_input": user_input})
+        entry.add_to_hass(hass)
+        entries.append(entry)
+    await _setup(hass, tion_entry)  # sets up all entries of the domain
+    assert all(entry.state is ConfigEntryState.LOADED for entry in entries)
+    coordinators = [hass.data[TION_API][entry.entry_id] for entry in entries]
+
+    planned = hass.data[TION_SCHEDULER].as_dict()["planned_in"]
+    assert len(planned) == len(entries)
+    assert min(b - a for a, b in zip(planned, planned[1:])) >= 60 / len(entries) * 0.5
+    assert max(planned) <= coordinators[0].scheduler.max_interval
+
+    simulator.latency = 0.05
+    simulator.max_in_flight = 0
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await asyncio.gather(*(coordinator.async_refresh() for coordinator in coordinators))
+    benchmark_report("poll accounts", result, POLL_CYCLES)
+
+    assert all(coordinator.last_update_success for coordinator in coordinators)
+    assert simulator.max_in_flight <= MAX_GLOBAL_CALLS
+    assert len(hass.states.async_entity_ids(CLIMATE_DOMAIN)) == len(entries) * len(simulator.zones) * 2
+    for entry in entries:
+        await _unload(hass, entry)
+
+
+async def test_poll_cycle_unchanged(hass: HomeAssistant, tion_cloud, tion_entry, benchmark_report):
+    simulator = await tion_cloud(**SITES["office"])
+    await _setup(hass, tion_entry)
+    coordinator = hass.data[TION_API][tion_entry.entry_id]
+    await coordinator.async_refresh()
+    skipped = coordinator.skipped_polls
+
+    async with measure(hass, simulator) as result:
+        for _ in range(POLL_CYCLES):
+            await coordinator.async_refresh()
+    benchmark_report("poll unchanged", result, POLL_CYCLES)
+
+    assert coordinator.skipped_polls - skipped == POLL_CYCLES
+    assert coordinator.data.parsed == 0
+    assert result.state_writes == 0
+
+    previous = coordinator.data
+    simulator.zones[0]["devices"][0]["data"]["speed"] = 4
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert coordinator.data.parsed == 1
+    assert coordinator.skipped_polls - skipped == POLL_CYCLES
+    assert coordinator.data.devices["breezer-0-0"].speed == 4
+    assert coordinator.data.devices["breezer-0-1"] is previous.devices["breezer-0-1"]
+    assert hass.states.get("climate.breezer_0_0").attributes["speed"] == 4
+    await _unload(hass, tion_entry)
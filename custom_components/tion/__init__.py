@@ -1,73 +1,199 @@
 import logging
 
-from homeassistant.const import CONF_USERNAME, CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_FILE_PATH
+from homeassistant.const import (
+    CONF_USERNAME,
+    CONF_PASSWORD,
+    CONF_SCAN_INTERVAL,
+    CONF_FILE_PATH,
+    EVENT_HOMEASSISTANT_STOP,
+)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import device_registry as dr
-from tion import TionApi, Breezer, MagicAir
-
-from .const import DOMAIN, PLATFORMS, TION_API, BREEZER_DEVICE, MAGICAIR_DEVICE
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from .api import TionClient, TionApiError, TionAuthError
+from .auth import TionAuthStore
+from .const import (
+    DOMAIN,
+    PLATFORMS,
+    TION_API,
+    TION_SCHEDULER,
+    MAX_GLOBAL_CALLS,
+    CONF_COMMAND_DELAY,
+    CONF_LOCAL_CO2_CONTROL,
+    CONF_STATISTICS_ONLY,
+    DEFAULT_COMMAND_DELAY,
+    DEFAULT_LOCAL_CO2_CONTROL,
+    DEFAULT_STATISTICS_ONLY,
+)
+from .commands import commands_store
+from .controller import control_store
+from .coordinator import TionDataUpdateCoordinator, parse_locations
+from .scheduler import TionPollScheduler, TionGlobalScheduler, interval_bounds
+from .services import async_setup_services
+from .topology import TionTopologyStore
 
 _LOGGER = logging.getLogger(__name__)
 
+MODELS = {
+    "co2mb": "MagicAir",
+    "co2Plus": "Модуль CO2+",
+    "tionO2Rf": "Бризер O2",
+    "tionClever": "Clever",
+    "breezer3": "Бризер 3S",
+    "breezer4": "Бризер 4S"
+}
+
 
 async def async_setup(hass, config):
+    async_setup_services(hass)
     return True
 
 
-def create_api(user, password, interval, auth_fname):
-    return TionApi(user, password, min_update_interval_sec=interval, auth_fname=auth_fname)
-
-
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Setup DOMAIN as default
     hass.data.setdefault(TION_API, {})
+    if TION_SCHEDULER not in hass.data:
+        # polls and cloud calls of all accounts are spread and limited together
+        hass.data[TION_SCHEDULER] = TionGlobalScheduler(MAX_GLOBAL_CALLS)
+    planner: TionGlobalScheduler = hass.data[TION_SCHEDULER]
 
     user_input = entry.data['user_input']
 
-    api = await hass.async_add_executor_job(create_api,
-                                            user_input[CONF_USERNAME],
-                                            user_input[CONF_PASSWORD],
-                                            user_input[CONF_SCAN_INTERVAL],
-                                            user_input[CONF_FILE_PATH]
-                                            )
-
-    assert api.authorization, "Couldn't get authorisation data!"
-    _LOGGER.info(f"Api initialized with authorization {api.authorization}")
-
-    hass.data[TION_API][entry.entry_id] = api
+    auth_store = TionAuthStore(hass, user_input[CONF_FILE_PATH])
+    authorization, expires_at = await auth_store.async_load()
+    client = TionClient(async_get_clientsession(hass),
+                        user_input[CONF_USERNAME],
+                        user_input[CONF_PASSWORD],
+                        authorization,
+                        expires_at,
+                        auth_store.async_save,
+                        gate=planner.gate)
+
+    scheduler = TionPollScheduler(user_input[CONF_SCAN_INTERVAL],
+                                  *interval_bounds(user_input[CONF_SCAN_INTERVAL], entry.options),
+                                  planner, entry.entry_id)
+    topology = TionTopologyStore(hass, entry.entry_id)
+    statistics = None
+    if entry.options.get(CONF_STATISTICS_ONLY, DEFAULT_STATISTICS_ONLY):
+        from .longterm import statistics_store  # the recorder is needed only in this mode
+        statistics = statistics_store(hass, entry.entry_id)
+    coordinator = TionDataUpdateCoordinator(hass, client, scheduler,
+                                            entry.options.get(CONF_COMMAND_DELAY, DEFAULT_COMMAND_DELAY), topology,
+                                            commands_store(hass, entry.entry_id),
+                                            control_store(hass, entry.entry_id)
+                                            if entry.options.get(CONF_LOCAL_CO2_CONTROL, DEFAULT_LOCAL_CO2_CONTROL)
+                                            else None,
+                                            statistics)
+    await coordinator.commands.async_load()
+    if coordinator.controller is not None:
+        await coordinator.controller.async_load()
+    if coordinator.importer is not None:
+        await coordinator.importer.async_load()
+
+    cached = await topology.async_load()
+    if cached is not None:
+        # devices are known from the previous run, login and the first poll don't delay the startup
+        coordinator.async_set_cached(parse_locations(cached))
+    else:
+        if not client.token_valid:
+            try:
+                await client.async_login()
+            except TionAuthError as e:
+                _LOGGER.error(f"Couldn't get authorisation data: {e}")
+                return False
+            except TionApiError as e:
+                raise ConfigEntryNotReady(f"Couldn't get authorisation data: {e}") from e
+        await coordinator.async_config_entry_first_refresh()
+        _LOGGER.info("Api initialized")
+
+    hass.data[TION_API][entry.entry_id] = coordinator
 
     # Get the device registry
     device_registry = dr.async_get(hass)
 
-    devices = await hass.async_add_executor_job(api.get_devices)
-    models = {
-        "co2mb": "MagicAir",
-        "co2Plus": "Модуль CO2+",
-        "tionO2Rf": "Бризер O2",
-        "tionClever": "Clever",
-        "breezer3": "Бризер 3S",
-        "breezer4": "Бризер 4S"
-    }
-    device: Breezer
-    for device in devices:
-        if device.valid:
-            device_type = BREEZER_DEVICE if type(device) == Breezer else (
-                MAGICAIR_DEVICE if type(device) == MagicAir else None)
-            if device_type:
-                device_registry.async_get_or_create(
-                    config_entry_id=entry.entry_id,
-                    identifiers={(DOMAIN, device.guid)},
-                    manufacturer="TION",
-                    model=models.get(device.type, "Unknown device"),
-                    name=device.name,
-                )
-            else:
-                _LOGGER.info(f"Unused device {device}")
-        else:
-            _LOGGER.info(f"Skipped device {device}, because of 'valid' property")
+    # Hub device for cloud connection diagnostics
+    device_registry.async_get_or_create(
+        config_entry_id=entry.entry_id,
+        identifiers={(DOMAIN, entry.entry_id)},
+        manufacturer="TION",
+        model="MagicAir cloud",
+        name=f"Tion {entry.title}",
+        entry_type=dr.DeviceEntryType.SERVICE,
+    )
+
+    known_devices = coordinator.known(DOMAIN)
+
+    @callback
+    def _async_register_new_devices() -> None:
+        """Create registry devices for devices, which appeared since the previous poll."""
+        for device in coordinator.data.devices.values():
+            if device.guid in known_devices or not device.valid:
+                continue
+            known_devices.add(device.guid)
+            device_registry.async_get_or_create(
+                config_entry_id=entry.entry_id,
+                identifiers={(DOMAIN, device.guid)},
+                manufacturer="TION",
+                model=MODELS.get(device.type, "Unknown device"),
+                name=device.name,
+            )
+
+    _async_register_new_devices()
+    # added before platform listeners, so devices exist when entities of new devices are added
+    entry.async_on_unload(coordinator.async_add_listener(_async_register_new_devices))
+    if coordinator.controller is not None:
+        entry.async_on_unload(coordinator.async_add_listener(coordinator.controller.async_update))
+    if coordinator.importer is not None:
+        @callback
+        def _async_import_statistics(_event) -> None:
+            """Import the current hour before the recorder stops."""
+            coordinator.importer.async_flush()
+
+        entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_import_statistics))
 
     # Forward to sensor platform
     await hass.async_create_task(hass.config_entries.async_forward_entry_setups(entry, PLATFORMS))
 
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+    entry.async_on_unload(auth_store.async_flush)
+
+    if cached is not None:
+        entry.async_create_background_task(hass, coordinator.async_refresh(), "tion first refresh")
+
     return True
+
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        hass.data[TION_API].pop(entry.entry_id)
+        hass.data[TION_SCHEDULER].remove(entry.entry_id)
+    return unload_ok
+
+
+async def async_remove_config_entry_device(hass: HomeAssistant, entry: ConfigEntry,
+                                          device_entry: dr.DeviceEntry) -> bool:
+    """Allow removing devices, which are not returned by the cloud anymore."""
+    coordinator: TionDataUpdateCoordinator = hass.data[TION_API][entry.entry_id]
+    identifiers = [identifier for domain, identifier in device_entry.identifiers if domain == DOMAIN]
+    if any(identifier == entry.entry_id or identifier in coordinator.data.devices for identifier in identifiers):
+        return False
+    for guid in identifiers:
+        coordinator.async_forget(guid)  # the device and its entities are created again, if it comes back
+    return True
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await TionAuthStore(hass, entry.data["user_input"][CONF_FILE_PATH]).async_remove()
+    await TionTopologyStore(hass, entry.entry_id).async_remove()
+    await commands_store(hass, entry.entry_id).async_remove()
+    await control_store(hass, entry.entry_id).async_remove()
+    from .longterm import statistics_store  # the mode may have been switched off before removing
+    await statistics_store(hass, entry.entry_id).async_remove()
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
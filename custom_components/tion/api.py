@@ -0,0 +1,225 @@
+"""Asyncio client for Tion MagicAir cloud"""
+import asyncio
+import logging
+from contextlib import nullcontext
+from time import monotonic, time
+from typing import Any, Callable
+
+import aiohttp
+
+from .const import (
+    RATE_LIMIT,
+    RATE_LIMIT_BURST,
+    BREAKER_THRESHOLD,
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    BACKOFF_JITTER,
+    FAST_POLL_WINDOW,
+)
+from .limiter import TionRateLimiter, TionCircuitBreaker, TionCallGate
+from .stats import TionCallStats
+
+_LOGGER = logging.getLogger(__name__)
+
+API_URL = "https://api2.magicair.tion.ru"
+CLIENT_ID = "cd594955-f5ba-4c20-9583-5990bb29f4ef"
+CLIENT_SECRET = "syRxSrT77P"
+REQUEST_TIMEOUT = 10
+TASK_POLL_DELAY = 0.5
+TASK_MAX_TIME = 5
+TOKEN_EXPIRY_MARGIN = 60
+
+
+class TionApiError(Exception):
+    """Error while talking to Tion cloud."""
+
+
+class TionAuthError(TionApiError):
+    """Tion cloud rejected the credentials."""
+
+
+class TionUnreachableError(TionApiError):
+    """Tion cloud couldn't be reached or is overloaded, the call may succeed later."""
+
+
+class TionCircuitOpenError(TionUnreachableError):
+    """Cloud calls are paused after repeated failures."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Tion cloud calls are paused for {retry_in:.0f}sec after repeated failures")
+        self.retry_in = retry_in
+
+
+class TionClient:
+    """Tion cloud API client working on a shared aiohttp session."""
+
+    def __init__(self, session: aiohttp.ClientSession, username: str, password: str,
+                 authorization: str | None = None, expires_at: float | None = None,
+                 on_token: Callable[[str, float | None], None] | None = None, base_url: str | None = None,
+                 gate: TionCallGate | None = None):
+        self._session = session
+        self._username = username
+        self._password = password
+        self._base_url = base_url or API_URL
+        self._on_token = on_token
+        self.authorization = authorization
+        self.expires_at = expires_at
+        self.stats = TionCallStats()
+        self.limiter = TionRateLimiter(RATE_LIMIT, RATE_LIMIT_BURST)
+        self.breaker = TionCircuitBreaker(BREAKER_THRESHOLD, BACKOFF_BASE, BACKOFF_MAX, BACKOFF_JITTER)
+        self.gate = gate
+        self._commanded_at = float("-inf")
+        self._login_lock = asyncio.Lock()
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "Accept": "application/json, text/plain, */*",
+            "Accept-Language": "ru-RU",
+            "Authorization": self.authorization,
+            "Content-Type": "application/json",
+            "Origin": "https://magicair.tion.ru",
+            "Referer": "https://magicair.tion.ru/dashboard/overview",
+        }
+
+    async def _async_guard(self) -> None:
+        """Wait for the rate limiter or refuse the call while the circuit breaker is open."""
+        if not self.breaker.allow():
+            raise TionCircuitOpenError(self.breaker.retry_in)
+        await self.limiter.async_acquire()
+
+    def _slot(self):
+        """Return slot of the shared gate, calls of accounts with recent commands go first."""
+        if self.gate is None:
+            return nullcontext()
+        return self.gate.slot(0 if monotonic() - self._commanded_at < FAST_POLL_WINDOW else 1)
+
+    @staticmethod
+    def _status_error(message: str, response: aiohttp.ClientResponse) -> TionApiError:
+        """Return error of the response status, only server errors and throttling mean the cloud is unreachable."""
+        if response.status >= 500 or response.status == 429:
+            return TionUnreachableError(message)
+        return TionApiError(message)
+
+    def _record_failure(self, response: aiohttp.ClientResponse | None = None) -> None:
+        """Count failure in the circuit breaker, if it means the cloud is in trouble."""
+        if response is None or response.status >= 500:
+            self.breaker.record_failure()
+        elif response.status == 429:
+            retry_after = response.headers.get("Retry-After")
+            self.breaker.record_failure(float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+    async def async_login(self) -> str:
+        """Get new authorization token."""
+        data = {
+            "username": self._username,
+            "password": self._password,
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+            "grant_type": "password",
+        }
+        await self._async_guard()
+        start = monotonic()
+        ok = False
+        try:
+            async with self._slot(), \
+                    self._session.post(f"{self._base_url}/idsrv/oauth2/token", data=data,
+                                       timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+                if response.status in (400, 401):
+                    # repeated wrong credentials may lock the account, so they pause calls as well
+                    self.breaker.record_failure()
+                    raise TionAuthError(f"Authorization failed with status {response.status}")
+                if response.status != 200:
+                    self._record_failure(response)
+                    raise self._status_error(f"Status code while getting token: {response.status}", response)
+                js = await response.json(content_type=None)
+                ok = True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._record_failure()
+            raise TionUnreachableError(f"Exception while getting token: {e}") from e
+        finally:
+            self.stats.record("token", monotonic() - start, ok)
+        self.breaker.record_success()
+
+        self.authorization = f"{js['token_type']} {js['access_token']}"
+        self.expires_at = time() + js["expires_in"] if js.get("expires_in") else None
+        _LOGGER.info("Got new token")
+        if self._on_token is not None:
+            self._on_token(self.authorization, self.expires_at)
+        return self.authorization
+
+    @property
+    def token_valid(self) -> bool:
+        """Return True if there is a token, which is not going to expire soon."""
+        return self.authorization is not None and \
+            (self.expires_at is None or self.expires_at - TOKEN_EXPIRY_MARGIN > time())
+
+    async def _async_renew(self, rejected: str | None = None) -> None:
+        """Get new token once for all concurrent requests, `rejected` is the token refused by the cloud."""
+        async with self._login_lock:
+            if self.token_valid and self.authorization != rejected:
+                return  # renewed by another request meanwhile
+            await self.async_login()
+
+    async def _async_request(self, endpoint: str, method: str, path: str, json: dict | None = None) -> Any:
+        """Send authorized request, renewing the token once if it is expired."""
+        if not self.token_valid:
+            await self._async_renew()
+
+        for attempt in range(2):
+            await self._async_guard()
+            start = monotonic()
+            ok = False
+            rejected = None
+            try:
+                async with self._slot(), \
+                        self._session.request(method, f"{self._base_url}{path}", json=json, headers=self.headers,
+                                              timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+                    if response.status == 401 and attempt == 0:
+                        _LOGGER.info("Need to get new authorisation")
+                        rejected = response.request_info.headers.get("Authorization")
+                    elif response.status != 200:
+                        self._record_failure(response)
+                        raise self._status_error(f"Status code for {method} {path} is {response.status}", response)
+                    else:
+                        js = await response.json(content_type=None)
+                        ok = True
+                        self.breaker.record_success()
+                        return js
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record_failure()
+                raise TionUnreachableError(f"Exception in {method} {path}: {e}") from e
+            finally:
+                self.stats.record(endpoint, monotonic() - start, ok)
+            self.stats.record_retry()
+            await self._async_renew(rejected)
+
+    async def async_get_locations(self) -> list[dict]:
+        """Return raw data of all locations available to the account."""
+        return await self._async_request("location", "GET", "/location")
+
+    async def async_wait_for_task(self, task_id: str, max_time: float = TASK_MAX_TIME) -> bool:
+        """Wait until command task is completed by the cloud."""
+        for _ in range(int(max_time / TASK_POLL_DELAY)):
+            js = await self._async_request("task", "GET", f"/task/{task_id}")
+            if js.get("status") == "completed":
+                return True
+            await asyncio.sleep(TASK_POLL_DELAY)
+        _LOGGER.warning(f"Couldn't get completed status for {max_time}sec for task {task_id}")
+        return False
+
+    async def _async_send(self, endpoint: str, path: str, data: dict) -> bool:
+        self._commanded_at = monotonic()
+        js = await self._async_request(endpoint, "POST", path, json=data)
+        if js.get("status") != "queued":
+            _LOGGER.error(f"Command {path} {js.get('status')}: {js.get('description')}")
+            return False
+        return await self.async_wait_for_task(js["task_id"])
+
+    async def async_send_zone(self, guid: str, data: dict) -> bool:
+        """Send zone mode command."""
+        return await self._async_send("zone", f"/zone/{guid}/mode", data)
+
+    async def async_send_device(self, guid: str, data: dict) -> bool:
+        """Send breezer mode command."""
+        return await self._async_send("device", f"/device/{guid}/mode", data)
@@ -0,0 +1,47 @@
+"""Persistent storage of Tion cloud authorization"""
+from time import time
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 10
+
+
+class TionAuthStore:
+    """Keep authorization token of an account in Home Assistant storage."""
+
+    def __init__(self, hass: HomeAssistant, key: str):
+        self._store = Store(hass, STORAGE_VERSION, key, private=True)
+        self._pending: dict | None = None  # token waiting for the delayed save
+
+    async def async_load(self) -> tuple[str | None, float | None]:
+        """Return stored token and its expiration time, if it is still valid."""
+        data = await self._store.async_load() or {}
+        authorization = data.get("authorization")
+        expires_at = data.get("expires_at")
+        if expires_at is not None and expires_at <= time():
+            return None, None
+        return authorization, expires_at
+
+    @callback
+    def async_save(self, authorization: str, expires_at: float | None) -> None:
+        """Schedule token saving."""
+        self._pending = {"authorization": authorization, "expires_at": expires_at}
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        data, self._pending = self._pending, None
+        return data
+
+    async def async_flush(self) -> None:
+        """Save the token waiting for the delayed save at once, so it is not written after the entry is removed."""
+        if self._pending is not None:
+            await self._store.async_save(self._data_to_save())
+
+    async def async_save_now(self, authorization: str, expires_at: float | None) -> None:
+        await self._store.async_save({"authorization": authorization, "expires_at": expires_at})
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -1,12 +1,12 @@
 """Support for Tion breezer heater"""
+import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.components.climate import ClimateEntity
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.components.climate import DOMAIN as CLIMATE_DOMAIN, ClimateEntity
 from homeassistant.components.climate.const import (
     HVACMode,
-    ClimateEntityFeature,
     FAN_OFF,
     FAN_AUTO,
     ATTR_HVAC_MODE,
@@ -16,59 +16,109 @@ from homeassistant.const import (
     ATTR_TEMPERATURE,
     STATE_UNKNOWN,
 )
+from homeassistant.exceptions import HomeAssistantError
 
 _LOGGER = logging.getLogger(__name__)
 
-from tion import (
-    Breezer,
-    Zone,
-)
-
-from . import TION_API, DOMAIN
+from .api import TionApiError
+from .const import TION_API, DOMAIN, BREEZER_DEVICE, CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE
+from .coordinator import TionDataUpdateCoordinator
+from .entity import TionEntity
+from .models import BreezerState, ZoneState
+from .profiles import BreezerProfile, profile_of
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> bool:
-    tion = hass.data[TION_API][entry.entry_id]
-
-    entities = []
-    devices = await hass.async_add_executor_job(tion.get_devices)
-    for device in devices:
-        if device.valid:
-            if type(device) == Breezer:
-                entities.append(TionClimate(tion, device.guid))
-
-        else:
-            _LOGGER.info(f"Skipped device {device}, because of 'valid' property")
-
-    async_add_entities(entities)
+    coordinator: TionDataUpdateCoordinator = hass.data[TION_API][entry.entry_id]
+
+    max_silence = entry.options.get(CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE)
+    known = coordinator.known(CLIMATE_DOMAIN)
+    skipped = set()
+
+    @callback
+    def _async_add_new_breezers() -> None:
+        """Add entities of breezers, which appeared since the previous poll."""
+        snapshot = coordinator.data
+        entities = []
+        for guid in snapshot.by_type[BREEZER_DEVICE]:
+            if guid in known:
+                continue
+            if snapshot.devices[guid].valid:
+                known.add(guid)
+                entities.append(TionClimate(coordinator, guid, max_silence))
+            elif guid not in skipped:
+                skipped.add(guid)
+                _LOGGER.info(f"Skipped device {snapshot.devices[guid]}, because of 'valid' property")
+        if entities:
+            async_add_entities(entities)
+
+    _async_add_new_breezers()
+    entry.async_on_unload(coordinator.async_add_listener(_async_add_new_breezers))
 
     return True
 
 
-class TionClimate(ClimateEntity):
+class TionClimate(TionEntity, ClimateEntity):
     """Tion climate devices,include air conditioner,heater."""
 
-    def __init__(self, tion, guid):
+    # settings and values duplicated by sensors are not worth keeping in history
+    _unrecorded_attributes = frozenset({
+        "target_co2", "speed", "speed_min_set", "speed_max_set", "filter_need_replace", "t_in", "gate", "stale",
+    })
+
+    def __init__(self, coordinator: TionDataUpdateCoordinator, guid, max_silence: float):
         """Init climate device."""
-        self._breezer: Breezer = tion.get_devices(guid=guid)[0]
-        self._zone: Zone = tion.get_zones(guid=self._breezer.zone.guid)[0]
+        super().__init__(coordinator, max_silence)
+        self._guid = guid
+        # shown while the breezer is missing from polls, until it is removed by the user
+        self._last_breezer = coordinator.data.devices[guid]
+        self._last_zone = coordinator.data.zone_of(guid)
+        self._profile: BreezerProfile = profile_of(self._last_breezer)
         self._attr_temperature_unit = UnitOfTemperature.CELSIUS
         self._enable_turn_on_off_backwards_compatibility = False
-        self._attr_supported_features = \
-            ClimateEntityFeature.FAN_MODE | ClimateEntityFeature.TURN_OFF | ClimateEntityFeature.TURN_ON
-        if self._breezer.heater_installed:
-            self._attr_supported_features |= ClimateEntityFeature.TARGET_TEMPERATURE
+        self._attr_supported_features = self._profile.supported_features
+
+    @property
+    def _breezer(self) -> BreezerState:
+        return self.coordinator.data.devices.get(self._guid, self._last_breezer)
+
+    @property
+    def _zone(self) -> ZoneState:
+        return self.coordinator.data.zone_of(self._guid) or self._last_zone
+
+    def _records(self) -> tuple:
+        zone = self.coordinator.data.zone_of(self._guid)
+        return self.coordinator.data.devices.get(self._guid), zone, self._controlled(zone or self._last_zone)
+
+    def _controlled(self, zone: ZoneState) -> bool:
+        """Return True if speed of the zone is set by the local controller, fan mode is shown as auto."""
+        controller = self.coordinator.controller
+        return controller is not None and controller.controls(zone.guid)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self._guid in self.coordinator.data.devices:
+            breezer = self._breezer
+            if breezer is not self._last_breezer:  # records of unchanged breezers are reused by polls
+                self._last_breezer = breezer
+                self._profile = profile_of(breezer)
+                self._attr_supported_features = self._profile.supported_features
+            self._last_zone = self._zone
+        super()._handle_coordinator_update()
 
     @property
     def device_info(self):
         return {
-            "identifiers": {(DOMAIN, self._breezer.guid)},
+            "identifiers": {(DOMAIN, self._guid)},
         }
 
+    def _values(self) -> tuple:
+        return self._breezer, self._zone, self._controlled(self._zone)
+
     @property
     def unique_id(self):
         """Return a unique id identifying the entity."""
-        return self._breezer.guid
+        return self._guid
 
     @property
     def name(self):
@@ -79,7 +129,7 @@ class TionClimate(ClimateEntity):
     def hvac_mode(self):
         """Return current operation ie. heat, cool, idle."""
         if self._breezer.valid:
-            if self._breezer.is_on and self._breezer.speed > 0:
+            if self._breezer.speed > 0:  # speed is 0 when breezer is off
                 if self._breezer.heater_enabled:
                     return HVACMode.HEAT
                 else:
@@ -92,10 +142,7 @@ class TionClimate(ClimateEntity):
     @property
     def hvac_modes(self):
         """Return the list of available operation modes."""
-        _operations = [HVACMode.OFF, HVACMode.FAN_ONLY]
-        if self._breezer.heater_installed:
-            _operations.append(HVACMode.HEAT)
-        return _operations
+        return self._profile.hvac_modes
 
     @property
     def current_temperature(self):
@@ -115,9 +162,9 @@ class TionClimate(ClimateEntity):
     @property
     def fan_mode(self):
         """Return the fan setting."""
-        if self._zone.mode == "auto":
+        if self._zone.mode == "auto" or self._controlled(self._zone):
             return FAN_AUTO
-        elif not self._breezer.is_on:
+        elif not self._breezer.speed:
             return FAN_OFF
         else:
             return str(int(self._breezer.speed))
@@ -125,100 +172,100 @@ class TionClimate(ClimateEntity):
     @property
     def fan_modes(self):
         """Return the list of available fan modes."""
-        _fan_modes = [FAN_OFF, FAN_AUTO]
+        return self._profile.fan_modes
+
+    async def _async_apply(self, zone_changes: dict, breezer_changes: dict) -> None:
+        """Queue zone and breezer changes and wait until they are sent."""
+        commands = self.coordinator.commands
+        sends = []
+        if zone_changes:
+            sends.append(commands.async_set_zone(self._zone.guid, **zone_changes))
+        if breezer_changes:
+            sends.append(commands.async_set_breezer(self._guid, **breezer_changes))
         try:
-            _fan_modes.extend(range(0, int(self._breezer.speed_limit) + 1))
-        except Exception as e:
-            _fan_modes.extend(range(0, 7))
-            _LOGGER.info(f"breezer.speed_limit is \"{self._breezer.speed_limit}\", fan_modes set to 0-6")
-        return [str(m) for m in _fan_modes]
-
-    def set_temperature(self, **kwargs):
-        """Set new target temperature."""
-        if ATTR_TEMPERATURE in kwargs:
-            self._breezer.t_set = int(kwargs[ATTR_TEMPERATURE])
-            self._breezer.send()
-        if ATTR_HVAC_MODE in kwargs:
-            self.set_hvac_mode(kwargs[ATTR_HVAC_MODE])
-
-    def set_fan_mode(self, fan_mode):
-        """Set new target fan mode."""
-        new_mode = "manual"
-        new_speed = None
-        new_min_speed = new_max_speed = None
-        new_co2 = self._zone.target_co2
-        new_gate = None
-        if fan_mode == FAN_OFF:
-            new_speed = 0
-        elif fan_mode == FAN_AUTO:
-            new_mode = "auto"
-            new_min_speed = 0
-            new_max_speed = 6
-        else:
-            if fan_mode.isdigit():  # 1-6
-                new_speed = int(fan_mode)
-            elif fan_mode.count('-') == 0 and fan_mode.count(':') == 1:  # speed:gate
-                new_speed, new_gate = fan_mode.split(':')
-                new_speed = int(new_speed)
-                new_gate = int(new_gate)
-            elif fan_mode.count('-') == 1:  # {min}-{max}
-                new_mode = "auto"
-                speeds = fan_mode
-                if fan_mode.count(':') == 1:  # {min}-{max}:{co2}
-                    speeds, new_co2 = fan_mode.split(':')
-                new_min_speed, new_max_speed = speeds.split('-')
-                new_min_speed = int(new_min_speed)
-                new_max_speed = int(new_max_speed)
-        if self._zone.mode != new_mode or self._zone.target_co2 != new_co2:
-            if self._zone.mode != new_mode:
-                _LOGGER.info(f"Setting zone mode to {new_mode}")
-                self._zone.mode = new_mode
-            if self._zone.target_co2 != new_co2:
-                _LOGGER.info(f"Setting zone target co2 to {new_co2}")
-                self._zone.target_co2 = new_co2
-            self._zone.send()
-        if new_mode == "manual":
+            await asyncio.gather(*sends)
+        except TionApiError as e:
+            raise HomeAssistantError(f"Failed to send data to {self.name}: {e}") from e
+        finally:
+            if self.coordinator.controller is not None:
+                # the zone may be taken or released by the local controller without changing any record,
+                # entities of the zone show it and the controller sets the speed
+                self.coordinator.async_update_listeners()
+
+    def _fan_mode_changes(self, fan_mode) -> tuple[dict, dict]:
+        """Return zone and breezer fields to change for the fan mode, hand the zone to the local controller."""
+        command = self._profile.parse_fan_mode(fan_mode)
+        controller = self.coordinator.controller
+        local = controller is not None and command.mode == "auto"
+        new_mode = "manual" if local else command.mode  # speed is set by the local controller in manual mode
+        new_speed = command.speed
+        new_min_speed = command.speed_min
+        new_max_speed = command.speed_max
+        new_co2 = command.co2 if command.co2 is not None else self._zone.target_co2
+        new_gate = command.gate
+        zone_changes = {}
+        breezer_changes = {}
+        if self._zone.mode != new_mode:
+            _LOGGER.info(f"Setting zone mode to {new_mode}")
+            zone_changes["mode"] = new_mode
+        if self._zone.target_co2 != new_co2:
+            _LOGGER.info(f"Setting zone target co2 to {new_co2}")
+            zone_changes["target_co2"] = new_co2
+        if command.mode == "manual":
             if new_speed is not None:
                 _LOGGER.info(f"Setting breezer fan_mode to {new_speed}")
-                self._breezer.speed = new_speed
+                breezer_changes["speed"] = new_speed
                 if new_gate is not None:
-                    self._breezer.gate = new_gate
-                self._breezer.send()
+                    breezer_changes["gate"] = new_gate
         else:  # auto
             if (new_min_speed is not None and new_max_speed is not None) and \
                     (self.speed_min_set != new_min_speed or self.speed_max_set != new_max_speed):
                 _LOGGER.info(f"Sending breezer speeds {new_min_speed}-{new_max_speed}")
-                self._breezer.speed_min_set = new_min_speed
-                self._breezer.speed_max_set = new_max_speed
-                self._breezer.send()
-
-    def set_hvac_mode(self, hvac_mode):
-        """Set new target operation mode."""
+                breezer_changes["speed_min_set"] = new_min_speed
+                breezer_changes["speed_max_set"] = new_max_speed
+        if local:
+            controller.async_control(self._zone.guid)
+        elif controller is not None:
+            controller.async_release(self._zone.guid)
+        return zone_changes, breezer_changes
+
+    def _hvac_mode_changes(self, hvac_mode) -> tuple[dict, dict]:
+        """Return zone and breezer fields to change for the operation mode."""
         _LOGGER.info(f"Setting hvac mode to {hvac_mode}")
         if hvac_mode == HVACMode.OFF:
-            self.set_fan_mode(FAN_OFF)
+            return self._fan_mode_changes(FAN_OFF)
         elif hvac_mode == HVACMode.HEAT:
-            self._breezer.heater_enabled = True
-            self._breezer.send()
+            return {}, {"heater_enabled": True}
         elif hvac_mode == HVACMode.FAN_ONLY:
-            self._breezer.heater_enabled = False
-            self._breezer.send()
+            return {}, {"heater_enabled": False}
+        return {}, {}
 
-    def update(self):
-        """Fetch new state data for the breezer.
-        This is the only method that should fetch new data for Home Assistant.
-        """
-        self._zone.load()
-        self._breezer.load()
+    async def async_set_temperature(self, **kwargs) -> None:
+        """Set new target temperature."""
+        zone_changes = {}
+        breezer_changes = {}
+        if ATTR_HVAC_MODE in kwargs:
+            zone_changes, breezer_changes = self._hvac_mode_changes(kwargs[ATTR_HVAC_MODE])
+        if ATTR_TEMPERATURE in kwargs:
+            breezer_changes["t_set"] = int(kwargs[ATTR_TEMPERATURE])
+        await self._async_apply(zone_changes, breezer_changes)
+
+    async def async_set_fan_mode(self, fan_mode: str) -> None:
+        """Set new target fan mode."""
+        await self._async_apply(*self._fan_mode_changes(fan_mode))
+
+    async def async_set_hvac_mode(self, hvac_mode: HVACMode) -> None:
+        """Set new target operation mode."""
+        await self._async_apply(*self._hvac_mode_changes(hvac_mode))
 
-    def turn_off(self) -> None:
-        self.set_hvac_mode(HVACMode.OFF)
+    async def async_turn_off(self) -> None:
+        await self.async_set_hvac_mode(HVACMode.OFF)
 
-    def turn_on(self) -> None:
+    async def async_turn_on(self) -> None:
         if self._breezer.heater_enabled and self._breezer.heater_installed:
-            self.set_hvac_mode(HVACMode.HEAT)
+            await self.async_set_hvac_mode(HVACMode.HEAT)
         else:
-            self.set_hvac_mode(HVACMode.FAN_ONLY)
+            await self.async_set_hvac_mode(HVACMode.FAN_ONLY)
 
     @property
     def mode(self) -> str:
@@ -268,9 +315,7 @@ class TionClimate(ClimateEntity):
     @property
     def gate(self) -> str:
         """Return gate type"""
-        if self._breezer.type == "breezer4":
-            return "inside" if self._breezer.gate == 1 else ("outside" if self._breezer.gate == 0 else STATE_UNKNOWN)
-        return "inside" if self._breezer.gate == 0 else ("combined" if self._breezer.gate == 1 else ("outside" if self._breezer.gate == 2 else STATE_UNKNOWN))
+        return self._profile.gate_name(self._breezer.gate)
 
     @property
     def state_attributes(self) -> dict:
@@ -284,6 +329,7 @@ class TionClimate(ClimateEntity):
         data["filter_need_replace"] = self.filter_need_replace
         data["t_in"] = self.t_in
         data["gate"] = self.gate
+        data["stale"] = self.coordinator.stale
         return data
 
     @property
@@ -294,4 +340,5 @@ class TionClimate(ClimateEntity):
     @property
     def available(self) -> bool:
         """Return True if entity is available."""
-        return self._breezer.valid and self._zone.valid
+        return super().available and self._guid in self.coordinator.data.devices \
+            and self._breezer.valid and self._zone.valid
@@ -0,0 +1,378 @@
+"""Coalescing of breezer and zone commands"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+from time import time
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+
+from .api import TionApiError, TionUnreachableError
+from .const import MAX_PARALLEL_COMMANDS, OFFLINE_COMMAND_TTL
+from .models import BreezerState, ZoneState
+
+if TYPE_CHECKING:
+    from .coordinator import TionDataUpdateCoordinator, TionSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+ZONE = "zone"
+BREEZER = "breezer"
+
+# result of a command kept in the offline queue
+QUEUED = "queued"
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 1
+
+
+def commands_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Return storage of commands waiting for the cloud."""
+    return Store(hass, STORAGE_VERSION, f"tion.{entry_id}.commands")
+
+
+def zone_fields(zone: ZoneState) -> dict:
+    """Return writable zone fields."""
+    return {
+        "mode": zone.mode,
+        "target_co2": zone.target_co2,
+    }
+
+
+def breezer_fields(breezer: BreezerState) -> dict:
+    """Return writable breezer fields."""
+    return {
+        "speed": breezer.speed,
+        "heater_enabled": breezer.heater_enabled,
+        "t_set": breezer.t_set,
+        "speed_min_set": breezer.speed_min_set,
+        "speed_max_set": breezer.speed_max_set,
+        "gate": breezer.gate,
+    }
+
+
+def zone_data(fields: dict) -> dict:
+    """Return zone mode command payload."""
+    return {
+        "mode": fields["mode"] if fields["mode"] in ("auto", "manual") else "manual",
+        "co2": int(fields["target_co2"]) if fields["target_co2"] is not None else 900,
+    }
+
+
+def breezer_data(fields: dict, zone_mode: str) -> dict:
+    """Return breezer mode command payload."""
+    speed = int(fields["speed"] + 0.5) if fields["speed"] is not None else 0
+    heater_enabled = bool(fields["heater_enabled"]) if fields["heater_enabled"] is not None else False
+    data = {
+        "is_on": speed > 0,
+        "heater_enabled": heater_enabled,
+        "heater_mode": "heat" if heater_enabled else "maintenance",  # 4S model support
+        "t_set": int(fields["t_set"] + 0.5) if fields["t_set"] is not None else 10,
+        "speed": speed if speed > 0 else 1,
+        "speed_min_set": int(fields["speed_min_set"] + 0.5) if fields["speed_min_set"] is not None else 0,
+        "speed_max_set": int(fields["speed_max_set"] + 0.5) if fields["speed_max_set"] is not None else 6,
+    }
+    if zone_mode == "manual" and fields["gate"] is not None:
+        data["gate"] = fields["gate"]
+    return data
+
+
+class TionCommandQueue:
+    """Collect field changes for a short window and send one request per zone and breezer.
+
+    Later changes of the same field replace earlier ones. Zones are sent before breezers,
+    because the breezer payload depends on the zone mode.
+
+    Changes are shown optimistically right after they are queued and are kept over polled data
+    until the cloud confirms them. Rejected changes are rolled back.
+
+    At most MAX_PARALLEL_COMMANDS commands are in flight at once.
+
+    Changes, which couldn't be sent because the cloud is unreachable, stay shown and go to the offline
+    queue kept in storage, newer values of the same field replace older ones. The queue is sent again
+    in order after the next successful poll, changes older than OFFLINE_COMMAND_TTL are dropped.
+    """
+
+    def __init__(self, hass: HomeAssistant, coordinator: TionDataUpdateCoordinator, delay: float,
+                 store: Store | None = None):
+        self._hass = hass
+        self._coordinator = coordinator
+        self._delay = delay
+        self._store = store
+        self._pending: dict[tuple[str, str], dict] = {}
+        self._offline: dict[tuple[str, str], dict[str, tuple[Any, float]]] = {}  # field: (value, queued at)
+        self._waiters: dict[tuple[str, str], asyncio.Future] = {}
+        self._optimistic: dict[tuple[str, str], dict] = {}
+        self._previous: dict[tuple[str, str], dict] = {}
+        self._unsub_flush = None
+        self._semaphore = asyncio.Semaphore(MAX_PARALLEL_COMMANDS)
+
+    async def async_set_zone(self, guid: str, **fields) -> bool:
+        """Queue zone fields change and wait until it is sent."""
+        return await self._async_enqueue(ZONE, guid, fields)
+
+    async def async_set_breezer(self, guid: str, **fields) -> bool:
+        """Queue breezer fields change and wait until it is sent."""
+        return await self._async_enqueue(BREEZER, guid, fields)
+
+    def pending(self, kind: str, guid: str) -> dict:
+        """Return fields waiting to be sent."""
+        return self._pending.get((kind, guid), {})
+
+    @property
+    def queued(self) -> int:
+        """Return number of zones and breezers with changes waiting for the cloud."""
+        return len(self._offline)
+
+    async def async_load(self) -> None:
+        """Restore the offline queue saved before restart, its changes are shown until sent or expired."""
+        if self._store is None:
+            return
+        data = await self._store.async_load()
+        for command in (data or {}).get("commands", []):
+            key = (command["kind"], command["guid"])
+            fields = {field: (value, queued_at) for field, (value, queued_at) in command["fields"].items()}
+            self._offline[key] = fields
+            self._optimistic.setdefault(key, {}).update({field: value for field, (value, _) in fields.items()})
+
+    @callback
+    def _async_save(self) -> None:
+        if self._store is not None:
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {
+            "commands": [
+                {"kind": kind, "guid": guid, "fields": {field: list(item) for field, item in fields.items()}}
+                for (kind, guid), fields in self._offline.items()
+            ],
+        }
+
+    @callback
+    def async_replay(self) -> None:
+        """Send the offline queue again, the cloud is reachable."""
+        if self._offline:
+            _LOGGER.info(f"Sending {len(self._offline)} queued commands")
+            self._hass.async_create_task(self.async_flush())
+
+    @staticmethod
+    def _target(snapshot: TionSnapshot, kind: str, guid: str) -> ZoneState | BreezerState | None:
+        return snapshot.zones.get(guid) if kind == ZONE else snapshot.devices.get(guid)
+
+    @staticmethod
+    def _replace(snapshot: TionSnapshot, kind: str, guid: str, fields: dict) -> None:
+        """Put a copy of the record with changed fields into the snapshot."""
+        records = snapshot.zones if kind == ZONE else snapshot.devices
+        if guid in records and fields:
+            records[guid] = dataclasses.replace(records[guid], **fields)
+
+    def apply_optimistic(self, snapshot: TionSnapshot) -> None:
+        """Put not yet confirmed changes over freshly polled data."""
+        self._expire()
+        for (kind, guid), fields in self._optimistic.items():
+            self._replace(snapshot, kind, guid, fields)
+
+    def _confirm(self, key: tuple[str, str], sent: dict, success: bool) -> None:
+        """Forget confirmed changes or roll back rejected ones."""
+        optimistic = self._optimistic.get(key, {})
+        previous = self._previous.get(key, {})
+        rollback = {}
+        for field, value in sent.items():
+            if optimistic.get(field) != value:
+                continue  # changed again after sending, wait for the newer command
+            optimistic.pop(field)
+            if field in previous:  # unknown for changes queued before restart, the next poll brings them
+                rollback[field] = previous.pop(field)
+        if not success:
+            self._replace(self._coordinator.data, *key, rollback)
+        if not optimistic:
+            self._optimistic.pop(key, None)
+            self._previous.pop(key, None)
+
+    def _expire(self) -> None:
+        """Drop offline changes older than OFFLINE_COMMAND_TTL, polled values are shown instead."""
+        now = time()
+        expired_any = False
+        for key, fields in list(self._offline.items()):
+            expired = {field: value for field, (value, since) in fields.items() if now - since > OFFLINE_COMMAND_TTL}
+            if not expired:
+                continue
+            expired_any = True
+            for field in expired:
+                fields.pop(field)
+            if not fields:
+                self._offline.pop(key)
+            self._confirm(key, expired, True)
+            _LOGGER.warning(f"{key[0].capitalize()} {key[1]} couldn't be sent {expired} "
+                            f"within {OFFLINE_COMMAND_TTL}sec, dropped")
+        if expired_any:
+            self._async_save()
+
+    def _take_offline(self, pending: dict) -> dict[tuple[str, str], dict[str, float]]:
+        """Put offline changes in front of pending ones, return time every change was queued."""
+        now = time()
+        offline, self._offline = self._offline, {}
+        snapshot = self._coordinator.data
+        merged = {}
+        queued_at = {}
+        for key, fields in offline.items():
+            if self._target(snapshot, *key) is None:
+                _LOGGER.info(f"{key[0].capitalize()} {key[1]} is removed, dropping queued {fields}")
+                continue
+            merged[key] = {field: value for field, (value, _) in fields.items()}
+            queued_at[key] = {field: since for field, (_, since) in fields.items()}
+        for key, fields in pending.items():
+            merged.setdefault(key, {}).update(fields)
+            queued_at.setdefault(key, {}).update({field: now for field in fields})
+        pending.clear()
+        pending.update(merged)
+        if offline:
+            self._async_save()
+        return queued_at
+
+    def _queue_offline(self, key: tuple[str, str], fields: dict, queued_at: dict[str, float]) -> None:
+        """Keep changes, which couldn't be sent, for the next successful poll."""
+        offline = self._offline.setdefault(key, {})
+        for field, value in fields.items():
+            if field not in offline:  # newer change was queued while sending
+                offline[field] = (value, queued_at[field])
+
+    async def _async_enqueue(self, kind: str, guid: str, fields: dict) -> bool:
+        key = (kind, guid)
+        target = self._target(self._coordinator.data, kind, guid)
+        previous = self._previous.setdefault(key, {})
+        for field in fields:
+            previous.setdefault(field, getattr(target, field))
+        self._replace(self._coordinator.data, kind, guid, fields)
+        self._optimistic.setdefault(key, {}).update(fields)
+        self._coordinator.async_update_listeners()
+
+        self._pending.setdefault(key, {}).update(fields)
+        if key not in self._waiters:
+            self._waiters[key] = self._hass.loop.create_future()
+        waiter = self._waiters[key]
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(self._hass, self._delay, self._schedule_flush)
+        return await asyncio.shield(waiter)
+
+    @callback
+    def _schedule_flush(self, _now) -> None:
+        self._unsub_flush = None
+        self._hass.async_create_task(self.async_flush())
+
+    def _drop_removed(self, pending: dict, waiters: dict, kind: str | None = None) -> None:
+        """Drop changes of zones and breezers (or only of `kind`) removed by a poll since they were queued."""
+        snapshot = self._coordinator.data
+        for key in list(pending):
+            if kind is not None and key[0] != kind:
+                continue
+            target = self._target(snapshot, *key)
+            if target is not None and (key[0] == ZONE or target.zone_guid in snapshot.zones):
+                continue
+            fields = pending.pop(key)
+            _LOGGER.info(f"{key[0].capitalize()} {key[1]} is removed, dropping {fields}")
+            self._optimistic.pop(key, None)
+            self._previous.pop(key, None)
+            waiter = waiters.get(key)
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(TionApiError(f"{key[0].capitalize()} {key[1]} is removed"))
+
+    async def async_flush(self) -> None:
+        """Send all pending changes."""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        pending, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, {}
+        try:
+            await self._async_send(pending, waiters)
+        finally:
+            # callers wait for their changes, they are never left waiting after an unexpected error
+            for waiter in waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(TionApiError("Command was not sent"))
+
+    async def _async_send(self, pending: dict, waiters: dict) -> None:
+        queued_at = self._take_offline(pending)
+        self._drop_removed(pending, waiters)
+        if not pending:
+            return
+
+        snapshot = self._coordinator.data
+        client = self._coordinator.client
+        zone_modes = {}
+        zone_sends = {}
+        for (kind, guid), fields in pending.items():
+            if kind == ZONE:
+                merged = {**zone_fields(snapshot.zones[guid]), **fields}
+                zone_modes[guid] = merged["mode"]
+                _LOGGER.debug(f"Sending zone {guid}: {merged}")
+                zone_sends[(kind, guid)] = client.async_send_zone(guid, zone_data(merged))
+        results = await self._async_gather(zone_sends)
+
+        self._drop_removed(pending, waiters, BREEZER)  # the data may be polled again while zones are sent
+        snapshot = self._coordinator.data
+        breezer_sends = {}
+        for (kind, guid), fields in pending.items():
+            if kind == BREEZER:
+                merged = {**breezer_fields(snapshot.devices[guid]), **fields}
+                zone_guid = snapshot.devices[guid].zone_guid
+                zone_mode = zone_modes.get(zone_guid, snapshot.zones[zone_guid].mode)
+                _LOGGER.debug(f"Sending breezer {guid}: {merged}")
+                breezer_sends[(kind, guid)] = client.async_send_device(guid, breezer_data(merged, zone_mode))
+        results.update(await self._async_gather(breezer_sends))
+
+        queued = []
+        for key, result in results.items():
+            if isinstance(result, TionUnreachableError):
+                self._queue_offline(key, pending[key], queued_at[key])
+                queued.append(result)
+                result = QUEUED
+            else:
+                self._confirm(key, pending[key], result is True)
+                if result is not True:
+                    _LOGGER.warning(f"{key[0].capitalize()} {key[1]} rejected {pending[key]}, state is rolled back")
+            waiter = waiters.get(key)  # there is no waiter for replayed changes
+            if waiter is None or waiter.done():
+                continue
+            if isinstance(result, Exception):
+                waiter.set_exception(result)
+            else:
+                waiter.set_result(result)
+
+        if queued:
+            _LOGGER.warning(f"Tion cloud is unreachable, {len(queued)} commands are queued: {queued[0]}")
+            self._async_save()
+
+        self._coordinator.async_update_listeners()
+        if any(result is True for result in results.values()):  # nothing changed, if all are queued or refused
+            self._coordinator.scheduler.notify_command()
+            await self._coordinator.async_request_refresh()
+
+    async def _async_limited(self, send):
+        async with self._semaphore:
+            return await send
+
+    async def _async_gather(self, sends: dict) -> dict:
+        results = await asyncio.gather(*(self._async_limited(send) for send in sends.values()),
+                                       return_exceptions=True)
+        return dict(zip(sends.keys(), results))
+
+    async def async_shutdown(self) -> None:
+        """Cancel scheduled flush and save the offline queue for the next run."""
+        if self._store is not None and self._offline:
+            await self._store.async_save(self._data_to_save())
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        for waiter in self._waiters.values():
+            waiter.cancel()
+        self._waiters = {}
+        self._pending = {}
+        self._optimistic = {}
+        self._previous = {}
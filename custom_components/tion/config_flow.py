@@ -5,10 +5,32 @@ import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_USERNAME, CONF_PASSWORD, CONF_SCAN_INTERVAL, CONF_FILE_PATH
+from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
-from tion import TionApi
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-from .const import DOMAIN
+from .api import TionClient, TionApiError
+from .auth import TionAuthStore
+from .const import (
+    DOMAIN,
+    CONF_COMMAND_DELAY,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_CO2_DEADBAND,
+    CONF_TEMPERATURE_DEADBAND,
+    CONF_HUMIDITY_DEADBAND,
+    CONF_MAX_SILENCE,
+    CONF_LOCAL_CO2_CONTROL,
+    CONF_STATISTICS_ONLY,
+    DEFAULT_COMMAND_DELAY,
+    DEFAULT_CO2_DEADBAND,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DEFAULT_HUMIDITY_DEADBAND,
+    DEFAULT_MAX_SILENCE,
+    DEFAULT_LOCAL_CO2_CONTROL,
+    DEFAULT_STATISTICS_ONLY,
+)
+from .scheduler import interval_bounds
 
 DEFAULT_SCAN_INTERVAL = 60
 
@@ -16,10 +38,20 @@ DEFAULT_SCAN_INTERVAL = 60
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
-    def check_auth(self, user, password, interval, auth_fname) -> bool:
-        api = TionApi(user, password, min_update_interval_sec=interval, auth_fname=auth_fname)
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: config_entries.ConfigEntry) -> config_entries.OptionsFlow:
+        return OptionsFlowHandler(config_entry)
 
-        return api.get_data()
+    async def check_auth(self, user, password, auth_fname) -> bool:
+        """Validate credentials by getting a token, which is kept for the entry setup."""
+        client = TionClient(async_get_clientsession(self.hass), user, password)
+        try:
+            await client.async_login()
+        except TionApiError:
+            return False
+        await TionAuthStore(self.hass, auth_fname).async_save_now(client.authorization, client.expires_at)
+        return True
 
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
@@ -37,22 +69,17 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             except ValueError:
                 interval = DEFAULT_SCAN_INTERVAL
 
-            auth = await self.hass.async_add_executor_job(self.check_auth,
-                                                          user_input[CONF_USERNAME],
-                                                          user_input[CONF_PASSWORD],
-                                                          interval,
-                                                          auth_fname
-                                                          )
+            unique_id = f'{sha256_hex}'
+
+            # Checks that the device is actually unique, otherwise abort
+            await self.async_set_unique_id(unique_id)
+            self._abort_if_unique_id_configured()
+
+            auth = await self.check_auth(user_input[CONF_USERNAME], user_input[CONF_PASSWORD], auth_fname)
 
             if auth is False:
                 errors["base"] = "invalid_auth"
             else:
-                unique_id = f'{sha256_hex}'
-
-                # Checks that the device is actually unique, otherwise abort
-                await self.async_set_unique_id(unique_id)
-                self._abort_if_unique_id_configured()
-
                 return self.async_create_entry(
                     title=user_input[CONF_USERNAME],
                     data={
@@ -76,3 +103,50 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             ),
             errors=errors
         )
+
+
+class OptionsFlowHandler(config_entries.OptionsFlow):
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        self.config_entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        min_interval, max_interval = interval_bounds(self.config_entry.data["user_input"][CONF_SCAN_INTERVAL], options)
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(CONF_COMMAND_DELAY,
+                                 default=options.get(CONF_COMMAND_DELAY, DEFAULT_COMMAND_DELAY)):
+                        vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                    vol.Required(CONF_MIN_SCAN_INTERVAL,
+                                 default=min_interval):
+                        vol.All(vol.Coerce(int), vol.Range(min=5)),
+                    vol.Required(CONF_MAX_SCAN_INTERVAL,
+                                 default=max_interval):
+                        vol.All(vol.Coerce(int), vol.Range(min=5)),
+                    vol.Required(CONF_CO2_DEADBAND,
+                                 default=options.get(CONF_CO2_DEADBAND, DEFAULT_CO2_DEADBAND)):
+                        vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Required(CONF_TEMPERATURE_DEADBAND,
+                                 default=options.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND)):
+                        vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Required(CONF_HUMIDITY_DEADBAND,
+                                 default=options.get(CONF_HUMIDITY_DEADBAND, DEFAULT_HUMIDITY_DEADBAND)):
+                        vol.All(vol.Coerce(float), vol.Range(min=0)),
+                    vol.Required(CONF_MAX_SILENCE,
+                                 default=options.get(CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE)):
+                        vol.All(vol.Coerce(int), vol.Range(min=0)),
+                    vol.Required(CONF_LOCAL_CO2_CONTROL,
+                                 default=options.get(CONF_LOCAL_CO2_CONTROL, DEFAULT_LOCAL_CO2_CONTROL)): bool,
+                    vol.Required(CONF_STATISTICS_ONLY,
+                                 default=options.get(CONF_STATISTICS_ONLY, DEFAULT_STATISTICS_ONLY)): bool,
+                }
+            ),
+        )
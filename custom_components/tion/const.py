@@ -2,8 +2,58 @@ from homeassistant.const import Platform
 
 DOMAIN = 'tion'
 TION_API = "data_tion"
+TION_SCHEDULER = "data_tion_scheduler"
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.CLIMATE]
 
 # Device types
 MAGICAIR_DEVICE = "magicair"
 BREEZER_DEVICE = "breezer"
+
+# Options
+CONF_COMMAND_DELAY = "command_delay"
+DEFAULT_COMMAND_DELAY = 0.5
+CONF_MIN_SCAN_INTERVAL = "min_scan_interval"
+CONF_MAX_SCAN_INTERVAL = "max_scan_interval"
+DEFAULT_MIN_SCAN_INTERVAL = 15
+DEFAULT_MAX_SCAN_INTERVAL = 300
+CONF_CO2_DEADBAND = "co2_deadband"
+CONF_TEMPERATURE_DEADBAND = "temperature_deadband"
+CONF_HUMIDITY_DEADBAND = "humidity_deadband"
+CONF_MAX_SILENCE = "max_silence"
+DEFAULT_CO2_DEADBAND = 10
+DEFAULT_TEMPERATURE_DEADBAND = 0.5
+DEFAULT_HUMIDITY_DEADBAND = 1
+DEFAULT_MAX_SILENCE = 900
+CONF_LOCAL_CO2_CONTROL = "local_co2_control"
+DEFAULT_LOCAL_CO2_CONTROL = False
+CONF_STATISTICS_ONLY = "statistics_only"
+DEFAULT_STATISTICS_ONLY = False
+
+# Commands
+MAX_PARALLEL_COMMANDS = 4  # zone and breezer commands waiting for the cloud at once
+OFFLINE_COMMAND_TTL = 3600  # seconds, commands queued while the cloud is unreachable are dropped after that
+
+# Local CO2 control
+CO2_CONTROL_KP = 1 / 200  # speed steps per ppm above the zone target
+CO2_CONTROL_KI = 1 / 200 / 600  # speed steps per ppm and second, the error is integrated for about 10 minutes
+CO2_CONTROL_HYSTERESIS = 0.25  # speed steps over half a step before the speed is changed
+CO2_CONTROL_MIN_INTERVAL = 120  # seconds between speed changes of a zone
+
+# Rolling statistics
+ROLLING_WINDOWS = (300, 3600)  # seconds
+
+# Adaptive polling
+FAST_POLL_WINDOW = 60  # seconds of fast polling after a command or a large CO2 change
+CO2_CHANGE_THRESHOLD = 100  # ppm between two polls
+POLL_BACKOFF_FACTOR = 1.5
+POLL_JITTER = 0.1
+
+# Cloud call protection
+MAX_GLOBAL_CALLS = 4  # cloud calls in flight at once for all config entries
+RATE_LIMIT = 2  # requests per second on average
+RATE_LIMIT_BURST = 40
+BREAKER_THRESHOLD = 5  # failures in a row before calls are paused
+BACKOFF_BASE = 10  # seconds after the first failure, doubled with every next one
+BACKOFF_MAX = 600
+BACKOFF_JITTER = 0.2
+STALE_TIMEOUT = 3600  # seconds the last known state is shown while the cloud is failing
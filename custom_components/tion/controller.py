@@ -0,0 +1,156 @@
+"""Local CO2 control of breezer speed"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .api import TionApiError
+from .const import (
+    BREEZER_DEVICE,
+    MAGICAIR_DEVICE,
+    CO2_CONTROL_KP,
+    CO2_CONTROL_KI,
+    CO2_CONTROL_HYSTERESIS,
+    CO2_CONTROL_MIN_INTERVAL,
+)
+
+if TYPE_CHECKING:
+    from .coordinator import TionDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+
+
+def control_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Return storage of locally controlled zones."""
+    return Store(hass, STORAGE_VERSION, f"tion.{entry_id}.control")
+
+
+class TionCo2Controller:
+    """Keep CO2 of locally controlled zones at the zone target by changing breezer speed with a PI loop.
+
+    Zones are kept in manual mode in the cloud. On every poll the loop output is
+    `KP * error + integral` speed steps over `speed_min_set` of every breezer of the zone, limited by its
+    `speed_max_set`, where error is CO2 of the zone MagicAir stations above `target_co2`.
+    The speed is changed only when the output is more than half a step plus CO2_CONTROL_HYSTERESIS away
+    from the current speed, and not more often than once in CO2_CONTROL_MIN_INTERVAL per zone.
+    """
+
+    def __init__(self, hass: HomeAssistant, coordinator: TionDataUpdateCoordinator, store: Store):
+        self._hass = hass
+        self._coordinator = coordinator
+        self._store = store
+        self._zones: set[str] = set()
+        self._integral: dict[str, float] = {}
+        self._sampled: dict[str, float] = {}
+        self._changed: dict[str, float] = {}
+        self._snapshot = None
+        self.commands = 0
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        self._zones = set((data or {}).get("zones", []))
+
+    def controls(self, zone_guid: str) -> bool:
+        return zone_guid in self._zones
+
+    @callback
+    def async_control(self, zone_guid: str) -> None:
+        """Start controlling the zone, the speed is set on the next update."""
+        if zone_guid not in self._zones:
+            _LOGGER.info(f"Zone {zone_guid} is controlled locally")
+            self._zones.add(zone_guid)
+            self._snapshot = None
+            self._store.async_delay_save(self._data_to_save)
+
+    @callback
+    def async_release(self, zone_guid: str) -> None:
+        """Stop controlling the zone."""
+        if zone_guid in self._zones:
+            _LOGGER.info(f"Zone {zone_guid} is not controlled locally anymore")
+            self._zones.discard(zone_guid)
+            self._integral.pop(zone_guid, None)
+            self._sampled.pop(zone_guid, None)
+            self._store.async_delay_save(self._data_to_save)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"zones": sorted(self._zones)}
+
+    @callback
+    def async_update(self) -> None:
+        """Coordinator listener, compute speeds once per polled snapshot."""
+        snapshot = self._coordinator.data
+        if snapshot is None or snapshot is self._snapshot or not self._coordinator.last_update_success \
+                or self._coordinator.stale:
+            return
+        self._snapshot = snapshot
+        changes = {}
+        for zone_guid in self._zones:
+            changes.update(self._zone_changes(zone_guid))
+        if changes:
+            self._hass.async_create_task(self._async_send(changes))
+
+    def _zone_changes(self, zone_guid: str) -> dict[str, int]:
+        """Return new speed of breezers of the zone, which should change it."""
+        snapshot = self._snapshot
+        zone = snapshot.zones.get(zone_guid)
+        if zone is None or zone.target_co2 is None:
+            return {}
+        readings = [snapshot.devices[guid].co2 for guid in snapshot.zone_members(zone_guid, MAGICAIR_DEVICE)
+                    if snapshot.devices[guid].valid and snapshot.devices[guid].co2 is not None]
+        breezers = [snapshot.devices[guid] for guid in snapshot.zone_members(zone_guid, BREEZER_DEVICE)
+                    if snapshot.devices[guid].valid]
+        if not readings or not breezers:
+            return {}
+
+        now = monotonic()
+        error = sum(readings) / len(readings) - zone.target_co2
+        span = max((breezer.speed_max_set or 0) - (breezer.speed_min_set or 0) for breezer in breezers)
+        elapsed = now - self._sampled.get(zone_guid, now)
+        self._sampled[zone_guid] = now
+        # the integral is limited by the speed range, so it doesn't wind up while speed is at the limit
+        integral = self._integral.get(zone_guid, 0.0) + CO2_CONTROL_KI * error * elapsed
+        integral = min(max(integral, 0.0), float(span))
+        self._integral[zone_guid] = integral
+        output = CO2_CONTROL_KP * error + integral
+
+        changes = {}
+        for breezer in breezers:
+            speed_min = breezer.speed_min_set or 0
+            speed_max = breezer.speed_max_set if breezer.speed_max_set is not None else speed_min
+            speed = min(max(speed_min + output, speed_min), speed_max)
+            current = breezer.speed or 0
+            if abs(speed - current) > 0.5 + CO2_CONTROL_HYSTERESIS and int(speed + 0.5) != current:
+                changes[breezer.guid] = int(speed + 0.5)
+        if changes and now - self._changed.get(zone_guid, -CO2_CONTROL_MIN_INTERVAL) < CO2_CONTROL_MIN_INTERVAL:
+            _LOGGER.debug(f"Zone {zone_guid} speed was changed recently, keeping it")
+            return {}
+        if changes:
+            self._changed[zone_guid] = now
+            _LOGGER.debug(f"Zone {zone_guid} CO2 error {error:.0f}ppm, output {output:.2f}, speeds {changes}")
+        return changes
+
+    async def _async_send(self, changes: dict[str, int]) -> None:
+        self.commands += len(changes)
+        results = await asyncio.gather(
+            *(self._coordinator.commands.async_set_breezer(guid, speed=speed) for guid, speed in changes.items()),
+            return_exceptions=True)
+        for guid, result in zip(changes, results):
+            if isinstance(result, TionApiError):
+                _LOGGER.warning(f"Couldn't set speed of breezer {guid}: {result}")
+            elif isinstance(result, Exception):
+                raise result
+
+    def as_dict(self) -> dict:
+        return {
+            "zones": len(self._zones),
+            "commands": self.commands,
+            "integral": {zone_guid: round(value, 2) for zone_guid, value in self._integral.items()},
+        }
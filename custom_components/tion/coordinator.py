@@ -0,0 +1,194 @@
+"""Shared data coordinator for Tion location"""
+import logging
+from time import monotonic
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
+
+from .api import TionClient, TionApiError
+from .commands import TionCommandQueue
+from .controller import TionCo2Controller
+from .const import DOMAIN, BREEZER_DEVICE, MAGICAIR_DEVICE, STALE_TIMEOUT, ROLLING_WINDOWS
+from .models import BreezerState, MagicAirState, ZoneState
+from .rolling import TionRollingStatistics
+from .scheduler import TionPollScheduler
+from .topology import TionTopologyStore
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TionSnapshot:
+    """Immutable zone and device records of the account indexed by guid.
+
+    Records are only replaced as a whole on the event loop, so entities never see partially updated data.
+    `sections` keeps the raw data every record was parsed from, so unchanged records are reused by the next poll.
+    """
+
+    __slots__ = ("devices", "zones", "zone_devices", "by_type", "sections", "parsed")
+
+    def __init__(self):
+        self.devices: dict[str, BreezerState | MagicAirState] = {}
+        self.zones: dict[str, ZoneState] = {}
+        self.zone_devices: dict[str, list[str]] = {}
+        self.by_type: dict[str, list[str]] = {BREEZER_DEVICE: [], MAGICAIR_DEVICE: []}
+        self.sections: dict[str, tuple] = {}  # guid: (raw data, parsed record)
+        self.parsed = 0  # number of records parsed, not reused
+
+    def zone_of(self, guid: str) -> ZoneState | None:
+        """Return zone the device belongs to."""
+        device = self.devices.get(guid)
+        return self.zones.get(device.zone_guid) if device is not None else None
+
+    def zone_members(self, zone_guid: str, device_type: str | None = None) -> list[str]:
+        """Return guids of devices in the zone, optionally of one type only."""
+        guids = self.zone_devices.get(zone_guid, [])
+        if device_type is None:
+            return guids
+        return [guid for guid in guids if guid in self.by_type[device_type]]
+
+
+def _reuse(previous: TionSnapshot | None, guid: str, raw: tuple):
+    """Return record of the previous poll parsed from equal raw data."""
+    section = previous.sections.get(guid) if previous is not None else None
+    return section[1] if section is not None and section[0] == raw else None
+
+
+def parse_locations(locations: list[dict], previous: TionSnapshot | None = None) -> TionSnapshot:
+    """Build device and zone records from raw location data.
+
+    Records of zones and devices, whose raw data is equal to the one of the `previous` snapshot, are reused
+    as they are, so parsing is skipped for them and entities can tell them unchanged by identity.
+    """
+    snapshot = TionSnapshot()
+    for location in locations:
+        for zone_data in location.get("zones", []):
+            # zone record depends only on these keys, devices are compared one by one
+            raw = (zone_data.get("guid"), zone_data.get("name"), zone_data.get("mode"))
+            zone = _reuse(previous, raw[0], raw)
+            if zone is None:
+                zone = ZoneState.from_data(zone_data)
+                snapshot.parsed += 1
+            snapshot.sections[zone.guid] = (raw, zone)
+            snapshot.zones[zone.guid] = zone
+            snapshot.zone_devices[zone.guid] = []
+            for device_data in zone_data.get("devices", []):
+                device_type = device_data.get("type", "")
+                if "co2" in device_type:
+                    device_class, by_type = MagicAirState, MAGICAIR_DEVICE
+                elif "breezer" in device_type or "O2" in device_type:
+                    device_class, by_type = BreezerState, BREEZER_DEVICE
+                else:
+                    _LOGGER.info(f"Unused device {device_data.get('name')} of type {device_type}")
+                    continue
+                raw = (zone.guid, device_data)
+                device = _reuse(previous, device_data.get("guid"), raw)
+                if device is None:
+                    device = device_class.from_data(device_data, zone.guid)
+                    snapshot.parsed += 1
+                snapshot.sections[device.guid] = (raw, device)
+                snapshot.by_type[by_type].append(device.guid)
+                snapshot.devices[device.guid] = device
+                snapshot.zone_devices[zone.guid].append(device.guid)
+    return snapshot
+
+
+def snapshot_values(snapshot: TionSnapshot) -> dict:
+    """Return records of all devices and zones for comparing polls."""
+    return {**snapshot.devices, **snapshot.zones}
+
+
+class TionDataUpdateCoordinator(DataUpdateCoordinator):
+    """Fetch the whole Tion location once per interval for all entities of a config entry.
+
+    While the cloud is failing the last good snapshot is kept and marked stale for up to
+    STALE_TIMEOUT seconds, and polls follow the backoff of the client circuit breaker.
+    Polls returning the same data as the previous one are counted as skipped: nothing is parsed and
+    entities find their records unchanged.
+    """
+
+    def __init__(self, hass: HomeAssistant, client: TionClient, scheduler: TionPollScheduler,
+                 command_delay: float, topology: TionTopologyStore | None = None,
+                 commands_store: Store | None = None, control_store: Store | None = None,
+                 statistics_store: Store | None = None):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=DOMAIN,
+            update_interval=scheduler.next_interval(None, {}),
+        )
+        self.client = client
+        self.scheduler = scheduler
+        self.commands = TionCommandQueue(hass, self, command_delay, commands_store)
+        self.controller = TionCo2Controller(hass, self, control_store) if control_store is not None else None
+        self.statistics = TionRollingStatistics(ROLLING_WINDOWS, scheduler.min_interval)
+        self.importer = None
+        if statistics_store is not None:
+            from .longterm import TionStatisticsImporter  # the recorder is needed only in this mode
+            self.importer = TionStatisticsImporter(hass, statistics_store)
+        self._topology = topology
+        self._values = None
+        self._last_success: float | None = None
+        self.stale = False
+        self.polls = 0
+        self.skipped_polls = 0
+        self._known: dict[str, set[str]] = {}
+
+    def known(self, name: str) -> set[str]:
+        """Return guids of devices, for which registry devices or entities of `name` platform are created."""
+        return self._known.setdefault(name, set())
+
+    @callback
+    def async_forget(self, guid: str) -> None:
+        """Forget the device removed by the user, it is added again if the cloud returns it later."""
+        for known in self._known.values():
+            known.discard(guid)
+
+    @callback
+    def async_set_cached(self, snapshot: TionSnapshot) -> None:
+        """Use devices known from the previous run until the first poll, entities stay unavailable."""
+        self.commands.apply_optimistic(snapshot)
+        self.data = snapshot
+        self.last_update_success = False
+
+    async def _async_update_data(self) -> TionSnapshot:
+        try:
+            locations = await self.client.async_get_locations()
+        except TionApiError as e:
+            self.update_interval = self.scheduler.retry_interval(self.client.breaker.retry_in)
+            if self._last_success is None or monotonic() - self._last_success > STALE_TIMEOUT:
+                self.stale = False
+                raise UpdateFailed(f"Couldn't get data from Tion cloud: {e}") from e
+            if not self.stale:
+                _LOGGER.warning(f"Couldn't get data from Tion cloud, keeping the last known state: {e}")
+            self.stale = True
+            return self.data
+        self._last_success = monotonic()
+        self.stale = False
+        previous = self.data
+        snapshot = parse_locations(locations, previous)
+        self.polls += 1
+        # nothing parsed and nothing removed
+        unchanged = previous is not None and not snapshot.parsed and len(snapshot.sections) == len(previous.sections)
+        if unchanged:
+            self.skipped_polls += 1
+        self.statistics.add(snapshot, self._last_success)
+        if self.importer is not None:
+            self.importer.add(snapshot, dt_util.utcnow())
+        self.commands.apply_optimistic(snapshot)
+        if self._topology is not None and not unchanged:
+            await self._topology.async_update(locations)
+
+        values = snapshot_values(snapshot)
+        self.update_interval = self.scheduler.next_interval(self._values, values)
+        self._values = values
+        self.commands.async_replay()
+        return snapshot
+
+    async def async_shutdown(self) -> None:
+        await self.commands.async_shutdown()
+        if self.importer is not None:
+            self.importer.async_flush()
+            await self.importer.async_save()
+        await super().async_shutdown()
@@ -0,0 +1,42 @@
+"""Diagnostics support for Tion"""
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_USERNAME, CONF_PASSWORD
+from homeassistant.core import HomeAssistant
+
+from .const import TION_API, TION_SCHEDULER
+from .coordinator import TionDataUpdateCoordinator
+
+TO_REDACT = {CONF_USERNAME, CONF_PASSWORD}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: TionDataUpdateCoordinator = hass.data[TION_API][entry.entry_id]
+    snapshot = coordinator.data
+    return {
+        "entry": {
+            "data": async_redact_data(entry.data.get("user_input", {}), TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "stale": coordinator.stale,
+            "polls": coordinator.polls,
+            "skipped_polls": coordinator.skipped_polls,
+            "update_interval": coordinator.update_interval.total_seconds() if coordinator.update_interval else None,
+        },
+        "devices": {device_type: len(guids) for device_type, guids in snapshot.by_type.items()} if snapshot else {},
+        "zones": [
+            {device_type: len(snapshot.zone_members(zone_guid, device_type)) for device_type in snapshot.by_type}
+            for zone_guid in snapshot.zones
+        ] if snapshot else [],
+        "api": coordinator.client.stats.as_dict(),
+        "circuit_breaker": coordinator.client.breaker.as_dict(),
+        "rate_limiter": {"throttled": coordinator.client.limiter.throttled},
+        "queued_commands": coordinator.commands.queued,
+        "global_scheduler": hass.data[TION_SCHEDULER].as_dict(),
+        "co2_control": coordinator.controller.as_dict() if coordinator.controller is not None else None,
+    }
@@ -0,0 +1,68 @@
+"""Base entity of Tion integration"""
+from time import monotonic
+from typing import Any
+
+from homeassistant.core import callback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import TionDataUpdateCoordinator
+
+
+class TionEntity(CoordinatorEntity[TionDataUpdateCoordinator]):
+    """Entity writing its state only when shown values change.
+
+    Values within the deadband of the published ones are held back until `max_silence` seconds
+    have passed since the last write. Updates, which bring the same records as the previous one, are
+    skipped without computing values.
+    """
+
+    def __init__(self, coordinator: TionDataUpdateCoordinator, max_silence: float):
+        super().__init__(coordinator)
+        self._max_silence = max_silence
+        self._published = None
+        self._published_at = 0.0
+        self._source = None
+
+    def _records(self) -> tuple | None:
+        """Return records the shown values are computed from, None if values depend on more than records."""
+        return None
+
+    def _values(self) -> Any:
+        """Return values shown by the entity, called only while it is available."""
+        raise NotImplementedError
+
+    def _unchanged(self, published: Any, values: Any) -> bool:
+        return published == values
+
+    def _current(self) -> tuple:
+        available = self.available
+        return available, self.coordinator.stale, self._values() if available else None
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        # the state is written right after adding
+        self._published = self._current()
+        self._published_at = monotonic()
+
+    def _source_unchanged(self) -> bool:
+        """Return True if records and status are the same as on the previous update."""
+        records = self._records()
+        source = (self.coordinator.last_update_success, self.coordinator.stale, records)
+        unchanged = records is not None and source == self._source
+        self._source = source
+        return unchanged
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self._source_unchanged() and monotonic() - self._published_at < self._max_silence:
+            return
+        values = self._current()
+        available = values[0]
+        if self._published is not None and monotonic() - self._published_at < self._max_silence:
+            published_available, published_stale, published_values = self._published
+            if (available, self.coordinator.stale) == (published_available, published_stale) and \
+                    (not available or self._unchanged(published_values, values[2])):
+                return
+        self._published = values
+        self._published_at = monotonic()
+        self.async_write_ha_state()
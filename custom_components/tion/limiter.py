@@ -0,0 +1,148 @@
+"""Protection of Tion cloud account from request storms"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from contextlib import asynccontextmanager
+from time import monotonic
+
+_LOGGER = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class TionRateLimiter:
+    """Token bucket shared by all cloud calls of a config entry."""
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+        self.throttled = 0
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self._rate, self._burst)
+        self._updated = now
+
+    async def async_acquire(self) -> None:
+        """Wait until a call is allowed by the bucket."""
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                self.throttled += 1
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class TionCallGate:
+    """Limit cloud calls in flight at once, shared by all config entries.
+
+    Waiting calls get free slots in priority order, lower goes first, and in arrival order within a priority.
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self.waited = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    async def async_acquire(self, priority: int) -> None:
+        if self._active < self._limit and not self._waiters:
+            self._active += 1
+            return
+        self.waited += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot was handed over already
+            raise
+
+    def release(self) -> None:
+        """Hand the slot over to the first waiting call or free it."""
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self.async_acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class TionCircuitBreaker:
+    """Count consecutive failures, back off exponentially and stop calling the cloud after too many of them.
+
+    Every failure delays the next attempt by `base * 2 ** (failures - 1)` seconds with jitter, up to `max_backoff`.
+    After `threshold` failures the breaker opens and calls are refused until the delay passes. Then it is
+    half-open: calls go through again, the first success closes it and a failure opens it for a longer time.
+    """
+
+    def __init__(self, threshold: int, base_backoff: float, max_backoff: float, jitter: float):
+        self._threshold = threshold
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+        self._retry_at = 0.0
+        self.failures = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self._threshold:
+            return CLOSED
+        return OPEN if monotonic() < self._retry_at else HALF_OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Return seconds until the next attempt is worth making."""
+        return max(self._retry_at - monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        return self.state != OPEN
+
+    def record_success(self) -> None:
+        if self.failures >= self._threshold:
+            _LOGGER.info("Tion cloud is reachable again")
+        self.failures = 0
+        self._retry_at = 0.0
+
+    def record_failure(self, retry_after: float | None = None) -> None:
+        """Record failed call, `retry_after` is the delay requested by the server."""
+        self.failures += 1
+        backoff = min(self._base_backoff * 2 ** (self.failures - 1), self._max_backoff)
+        backoff *= 1 + random.uniform(-self._jitter, self._jitter)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        self._retry_at = monotonic() + backoff
+        if self.failures == self._threshold:
+            self.opened += 1
+            _LOGGER.warning(f"Tion cloud failed {self.failures} times in a row, pausing calls for {backoff:.0f}sec")
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "retry_in": round(self.retry_in, 1),
+        }
@@ -0,0 +1,134 @@
+"""Hourly statistics of polled Tion values imported into the recorder"""
+import logging
+from datetime import datetime
+
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.const import UnitOfTemperature, PERCENTAGE, CONCENTRATION_PARTS_PER_MILLION
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .const import DOMAIN
+from .rolling import ROLLING_FIELDS
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 60
+
+FIELD_UNITS = {
+    "co2": CONCENTRATION_PARTS_PER_MILLION,
+    "temperature": UnitOfTemperature.CELSIUS,
+    "humidity": PERCENTAGE,
+    "t_in": UnitOfTemperature.CELSIUS,
+    "t_out": UnitOfTemperature.CELSIUS,
+}
+
+
+def statistics_store(hass: HomeAssistant, entry_id: str) -> Store:
+    """Return storage of values of the current hour, not imported yet."""
+    return Store(hass, STORAGE_VERSION, f"tion.{entry_id}.statistics")
+
+
+class _HourBucket:
+    __slots__ = ("name", "count", "total", "min", "max")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = self.max = None
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def as_list(self) -> list:
+        return [self.name, self.count, self.total, self.min, self.max]
+
+    @classmethod
+    def from_list(cls, data: list) -> "_HourBucket":
+        bucket = cls(data[0])
+        bucket.count, bucket.total, bucket.min, bucket.max = data[1:]
+        return bucket
+
+
+class TionStatisticsImporter:
+    """Aggregate polled values per hour in memory and import mean, min and max as external statistics.
+
+    Statistic ids are `tion:{guid}_{field}`. The current hour is imported when the next one starts and on
+    unload; an import of the same hour replaces the previous one. Values of the current hour are kept in
+    the store, so the hour is imported with values polled before a reload or restart too.
+    """
+
+    def __init__(self, hass: HomeAssistant, store: Store):
+        self._hass = hass
+        self._store = store
+        self._hour: datetime | None = None
+        self._buckets: dict[tuple[str, str], _HourBucket] = {}
+
+    async def async_load(self) -> None:
+        """Restore values of the hour polled before unload, the hour is imported when the next one starts."""
+        data = await self._store.async_load()
+        if not data or not data.get("hour"):
+            return
+        self._hour = dt_util.parse_datetime(data["hour"])
+        self._buckets = {(guid, field): _HourBucket.from_list(bucket) for guid, field, *bucket in data["values"]}
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {
+            "hour": self._hour.isoformat() if self._hour is not None else None,
+            "values": [[guid, field, *bucket.as_list()] for (guid, field), bucket in self._buckets.items()],
+        }
+
+    async def async_save(self) -> None:
+        if self._hour is not None:
+            await self._store.async_save(self._data_to_save())
+
+    def add(self, snapshot, now: datetime) -> None:
+        """Add values of the polled snapshot taken at `now`."""
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        if self._hour is not None and hour != self._hour:
+            self.async_flush()
+            self._buckets = {}
+        self._hour = hour
+        for device_type, fields in ROLLING_FIELDS.items():
+            for guid in snapshot.by_type.get(device_type, ()):
+                device = snapshot.devices[guid]
+                if not device.valid:
+                    continue
+                for field in fields:
+                    value = getattr(device, field)
+                    if value is None:
+                        continue
+                    key = (guid, field)
+                    if key not in self._buckets:
+                        self._buckets[key] = _HourBucket(f"{device.name} {field}")
+                    self._buckets[key].add(value)
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def async_flush(self) -> None:
+        """Import statistics of the current hour."""
+        for (guid, field), bucket in self._buckets.items():
+            metadata = StatisticMetaData(
+                has_mean=True,
+                has_sum=False,
+                name=bucket.name,
+                source=DOMAIN,
+                statistic_id=f"{DOMAIN}:{slugify(f'{guid}_{field}')}",
+                unit_of_measurement=FIELD_UNITS[field],
+            )
+            statistic = StatisticData(
+                start=self._hour,
+                mean=bucket.total / bucket.count,
+                min=bucket.min,
+                max=bucket.max,
+            )
+            async_add_external_statistics(self._hass, metadata, [statistic])
+        if self._buckets:
+            _LOGGER.debug(f"Imported statistics of {len(self._buckets)} values for {self._hour}")
@@ -0,0 +1,119 @@
+"""Immutable state records of Tion zones and devices"""
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class ZoneState:
+    """Zone as returned by one poll."""
+
+    guid: str
+    name: str
+    mode: str | None
+    target_co2: float | None
+
+    @property
+    def valid(self) -> bool:
+        return self.guid is not None
+
+    @classmethod
+    def from_data(cls, data: dict) -> "ZoneState":
+        mode = data.get("mode", {})
+        return cls(
+            guid=data.get("guid"),
+            name=data.get("name"),
+            mode=mode.get("current"),
+            target_co2=mode.get("auto_set", {}).get("co2"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MagicAirState:
+    """MagicAir base station as returned by one poll."""
+
+    guid: str
+    name: str
+    type: str
+    zone_guid: str
+    co2: float | None
+    temperature: float | None
+    humidity: float | None
+
+    @property
+    def valid(self) -> bool:
+        return self.guid is not None
+
+    @classmethod
+    def from_data(cls, device: dict, zone_guid: str) -> "MagicAirState":
+        data = device.get("data", {})
+        return cls(
+            guid=device.get("guid"),
+            name=device.get("name"),
+            type=device.get("type"),
+            zone_guid=zone_guid,
+            co2=data.get("co2"),
+            temperature=data.get("temperature"),
+            humidity=data.get("humidity"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class BreezerState:
+    """Breezer as returned by one poll."""
+
+    guid: str
+    name: str
+    type: str
+    firmware: str | None
+    zone_guid: str
+    data_valid: bool | None
+    is_on: bool | None
+    heater_installed: bool | None
+    heater_enabled: bool | None
+    t_set: float | None
+    speed: float | None
+    speed_min_set: float | None
+    speed_max_set: float | None
+    speed_limit: float | None
+    gate: int | None  # air source: 0 - inside, 1 - combined, 2 - outside
+    t_in: float | None
+    t_out: float | None
+    t_min: float | None
+    t_max: float | None
+    filter_need_replace: bool | None
+
+    @property
+    def valid(self) -> bool:
+        return self.guid is not None and bool(self.data_valid)
+
+    @classmethod
+    def from_data(cls, device: dict, zone_guid: str) -> "BreezerState":
+        data = device.get("data", {})
+        name = device.get("name")
+        heater_installed = data.get("heater_installed")
+        if heater_installed is None and name and "4S" in name:  # 4S does not give that for some reason
+            heater_installed = True
+        heater_enabled = data.get("heater_enabled")
+        if heater_enabled is None:
+            heater_enabled = data.get("heater_mode") == "heat"
+        return cls(
+            guid=device.get("guid"),
+            name=name,
+            type=device.get("type"),
+            firmware=device.get("firmware"),
+            zone_guid=zone_guid,
+            data_valid=data.get("data_valid"),
+            is_on=data.get("is_on"),
+            heater_installed=heater_installed,
+            heater_enabled=heater_enabled,
+            t_set=data.get("t_set"),
+            speed=data.get("speed") if data.get("is_on") else 0,  # Tion gives speed 1 even if it's off
+            speed_min_set=data.get("speed_min_set"),
+            speed_max_set=data.get("speed_max_set"),
+            speed_limit=data.get("speed_limit"),
+            gate=data.get("gate"),
+            t_in=data.get("t_in"),
+            t_out=data.get("t_out"),
+            t_min=device.get("t_min"),
+            t_max=device.get("t_max"),
+            filter_need_replace=data.get("filter_need_replace"),
+        )
@@ -0,0 +1,97 @@
+"""Capabilities of Tion breezer models"""
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+
+from homeassistant.components.climate.const import HVACMode, ClimateEntityFeature, FAN_OFF, FAN_AUTO
+from homeassistant.const import STATE_UNKNOWN
+
+from .models import BreezerState
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SPEED_LIMIT = 6
+
+# air source by gate value
+GATES = {0: "inside", 1: "combined", 2: "outside"}
+BREEZER4_GATES = {1: "inside", 0: "outside"}
+
+
+@dataclass(frozen=True, slots=True)
+class FanModeCommand:
+    """Fan mode parsed from `off`, `auto`, `{speed}`, `{speed}:{gate}`, `{min}-{max}` or `{min}-{max}:{co2}`."""
+
+    mode: str  # zone mode, auto or manual
+    speed: int | None = None
+    gate: int | None = None
+    speed_min: int | None = None
+    speed_max: int | None = None
+    co2: int | None = None  # None keeps the zone target
+
+
+@lru_cache(maxsize=64)
+def parse_fan_mode(fan_mode: str, speed_max: int = DEFAULT_SPEED_LIMIT) -> FanModeCommand:
+    """Return zone mode and speeds of the fan mode string, unknown strings only switch to manual mode."""
+    if fan_mode == FAN_OFF:
+        return FanModeCommand("manual", speed=0)
+    if fan_mode == FAN_AUTO:
+        return FanModeCommand("auto", speed_min=0, speed_max=speed_max)
+    if fan_mode.isdigit():  # 1-6
+        return FanModeCommand("manual", speed=int(fan_mode))
+    if fan_mode.count('-') == 0 and fan_mode.count(':') == 1:  # speed:gate
+        speed, gate = fan_mode.split(':')
+        return FanModeCommand("manual", speed=int(speed), gate=int(gate))
+    if fan_mode.count('-') == 1:  # {min}-{max}
+        speeds, co2 = fan_mode, None
+        if fan_mode.count(':') == 1:  # {min}-{max}:{co2}
+            speeds, co2 = fan_mode.split(':')
+        speed_min, speed_max = speeds.split('-')
+        return FanModeCommand("auto", speed_min=int(speed_min), speed_max=int(speed_max),
+                              co2=int(co2) if co2 is not None else None)
+    return FanModeCommand("manual")
+
+
+@dataclass(frozen=True, slots=True)
+class BreezerProfile:
+    """What a breezer model supports, shared by all breezers of the same model, firmware and installed options."""
+
+    speed_max: int
+    heater: bool
+    gates: dict[int, str]
+    fan_modes: list[str]
+    hvac_modes: list[HVACMode]
+    supported_features: ClimateEntityFeature
+
+    def gate_name(self, gate: int | None) -> str:
+        return self.gates.get(gate, STATE_UNKNOWN)
+
+    def parse_fan_mode(self, fan_mode: str) -> FanModeCommand:
+        return parse_fan_mode(fan_mode, self.speed_max)
+
+
+@lru_cache(maxsize=32)
+def _profile(device_type: str | None, firmware: str | None, heater_installed: bool | None,
+             speed_limit: float | None) -> BreezerProfile:
+    try:
+        speed_max = int(speed_limit)
+    except (TypeError, ValueError):
+        speed_max = DEFAULT_SPEED_LIMIT
+        _LOGGER.info(f"{device_type} speed_limit is \"{speed_limit}\", fan_modes set to 0-{speed_max}")
+    hvac_modes = [HVACMode.OFF, HVACMode.FAN_ONLY]
+    features = ClimateEntityFeature.FAN_MODE | ClimateEntityFeature.TURN_OFF | ClimateEntityFeature.TURN_ON
+    if heater_installed:
+        hvac_modes.append(HVACMode.HEAT)
+        features |= ClimateEntityFeature.TARGET_TEMPERATURE
+    return BreezerProfile(
+        speed_max=speed_max,
+        heater=bool(heater_installed),
+        gates=BREEZER4_GATES if device_type == "breezer4" else GATES,
+        fan_modes=[FAN_OFF, FAN_AUTO] + [str(speed) for speed in range(0, speed_max + 1)],
+        hvac_modes=hvac_modes,
+        supported_features=features,
+    )
+
+
+def profile_of(breezer: BreezerState) -> BreezerProfile:
+    """Return profile of the breezer, it is built again only when the breezer reports other capabilities."""
+    return _profile(breezer.type, breezer.firmware, breezer.heater_installed, breezer.speed_limit)
@@ -0,0 +1,118 @@
+"""Rolling statistics of polled Tion values"""
+import math
+from array import array
+from collections import deque
+
+from .const import BREEZER_DEVICE, MAGICAIR_DEVICE
+
+# record fields with rolling statistics by device type
+ROLLING_FIELDS = {
+    MAGICAIR_DEVICE: ("co2", "temperature", "humidity"),
+    BREEZER_DEVICE: ("t_in", "t_out"),
+}
+
+
+class TionRollingWindow:
+    """Mean, max and rate of change of the samples of the last `duration` seconds.
+
+    Samples are kept in preallocated arrays used as a ring buffer of `capacity` samples. When it is full of
+    samples of the window, because polls are faster than planned, the buffer is doubled. The sum and a queue of maximum candidates are updated when a sample is added
+    and when it is dropped, so every sample costs O(1) amortized.
+    """
+
+    def __init__(self, duration: float, capacity: int):
+        self.duration = duration
+        self._capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._first = 0  # sequence number of the oldest sample
+        self._next = 0
+        self._sum = 0.0
+        self._maxima = deque()  # (sequence number, value) with decreasing values
+
+    def __len__(self) -> int:
+        return self._next - self._first
+
+    def add(self, when: float, value: float) -> None:
+        """Add sample taken at monotonic time `when`."""
+        self.expire(when)
+        if len(self) == self._capacity:
+            self._grow()
+        index = self._next % self._capacity
+        self._times[index] = when
+        self._values[index] = value
+        self._sum += value
+        while self._maxima and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((self._next, value))
+        self._next += 1
+
+    def expire(self, now: float) -> None:
+        """Drop samples older than the window at monotonic time `now`."""
+        while len(self) and self._times[self._first % self._capacity] < now - self.duration:
+            self._drop()
+
+    def _grow(self) -> None:
+        capacity = self._capacity * 2
+        times = array("d", bytes(8 * capacity))
+        values = array("d", bytes(8 * capacity))
+        for sequence in range(self._first, self._next):
+            times[sequence % capacity] = self._times[sequence % self._capacity]
+            values[sequence % capacity] = self._values[sequence % self._capacity]
+        self._capacity, self._times, self._values = capacity, times, values
+
+    def _drop(self) -> None:
+        self._sum -= self._values[self._first % self._capacity]
+        if self._maxima[0][0] == self._first:
+            self._maxima.popleft()
+        self._first += 1
+        if not len(self):
+            self._sum = 0.0  # no rounding errors are carried over
+
+    @property
+    def mean(self) -> float | None:
+        return self._sum / len(self) if len(self) else None
+
+    @property
+    def max(self) -> float | None:
+        return self._maxima[0][1] if self._maxima else None
+
+    @property
+    def rate(self) -> float | None:
+        """Return change per hour between the oldest and the newest sample."""
+        if len(self) < 2:
+            return None
+        first = self._first % self._capacity
+        last = (self._next - 1) % self._capacity
+        elapsed = self._times[last] - self._times[first]
+        return (self._values[last] - self._values[first]) / elapsed * 3600 if elapsed > 0 else None
+
+
+class TionRollingStatistics:
+    """Rolling windows of polled values of every device."""
+
+    def __init__(self, durations: tuple[float, ...], min_interval: float):
+        self._durations = durations
+        self._min_interval = min_interval
+        self._windows: dict[tuple[str, str, float], TionRollingWindow] = {}
+
+    def add(self, snapshot, when: float) -> None:
+        """Add values of the polled snapshot."""
+        for device_type, fields in ROLLING_FIELDS.items():
+            for guid in snapshot.by_type.get(device_type, ()):
+                device = snapshot.devices[guid]
+                if not device.valid:
+                    continue
+                for field in fields:
+                    value = getattr(device, field)
+                    if value is None:
+                        continue
+                    for duration in self._durations:
+                        key = (guid, field, duration)
+                        if key not in self._windows:
+                            self._windows[key] = TionRollingWindow(
+                                duration, math.ceil(duration / self._min_interval) + 1)
+                        self._windows[key].add(when, value)
+
+    def window(self, guid: str, field: str, duration: float) -> TionRollingWindow | None:
+        return self._windows.get((guid, field, duration))
@@ -0,0 +1,139 @@
+"""Adaptive poll interval for Tion coordinator"""
+import logging
+import random
+from collections.abc import Mapping
+from datetime import timedelta
+from time import monotonic
+from typing import Any
+
+from .const import (
+    FAST_POLL_WINDOW,
+    CO2_CHANGE_THRESHOLD,
+    POLL_BACKOFF_FACTOR,
+    POLL_JITTER,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_MAX_SCAN_INTERVAL,
+)
+from .limiter import TionCallGate
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def interval_bounds(interval: float, options: Mapping[str, Any]) -> tuple[float, float]:
+    """Return min and max poll interval of the options, by default the configured interval is within them."""
+    return (options.get(CONF_MIN_SCAN_INTERVAL, min(DEFAULT_MIN_SCAN_INTERVAL, interval)),
+            options.get(CONF_MAX_SCAN_INTERVAL, max(DEFAULT_MAX_SCAN_INTERVAL, interval)))
+
+
+class TionGlobalScheduler:
+    """Plan polls of all config entries of the integration and share one gate of cloud calls between them.
+
+    The next poll of an entry stays at the end of its interval when it is at least `interval / entries` away
+    from planned polls of other entries, otherwise it is moved to the middle of the largest free gap between
+    the shortest and the current interval, so polls are spread instead of firing together.
+    Polls of entries with recent commands are not moved, others make way for them.
+    """
+
+    def __init__(self, max_calls: int):
+        self.gate = TionCallGate(max_calls)
+        self._planned: dict[str, float] = {}  # entry id: monotonic time of the next poll
+
+    def plan(self, entry_id: str, interval: float, urgent: bool = False, min_interval: float = 0) -> float:
+        """Return seconds until the next poll of the entry, between min_interval and interval."""
+        now = monotonic()
+        latest = now + interval
+        if urgent:
+            self._planned[entry_id] = latest
+            return interval
+        earliest = now + min(min_interval, interval)
+        others = sorted(planned for other, planned in self._planned.items() if other != entry_id and planned > now)
+
+        def clearance(at: float) -> float:
+            return min((abs(at - planned) for planned in others), default=interval)
+
+        at = latest
+        if clearance(at) < interval / (len(others) + 1):
+            bounds = [earliest, *(planned for planned in others if earliest < planned < latest), latest]
+            candidates = [latest, *((start + end) / 2 for start, end in zip(bounds, bounds[1:]))]
+            at = max(candidates, key=lambda candidate: (clearance(candidate), candidate))
+        self._planned[entry_id] = at
+        return at - now
+
+    def remove(self, entry_id: str) -> None:
+        self._planned.pop(entry_id, None)
+
+    def as_dict(self) -> dict:
+        now = monotonic()
+        return {
+            "entries": len(self._planned),
+            "planned_in": sorted(round(planned - now, 1) for planned in self._planned.values()),
+            "calls_in_flight": self.gate.active,
+            "calls_waited": self.gate.waited,
+        }
+
+
+class TionPollScheduler:
+    """Poll fast for a while after commands and large CO2 changes, back off while data is stable.
+
+    With the global scheduler, the poll is moved to spread polls of all config entries.
+    """
+
+    def __init__(self, interval: float, min_interval: float, max_interval: float,
+                 planner: TionGlobalScheduler | None = None, entry_id: str | None = None):
+        self._planner = planner
+        self._entry_id = entry_id
+        self._min_interval = min_interval
+        self._max_interval = max(max_interval, min_interval)
+        self._base_interval = min(max(interval, self._min_interval), self._max_interval)
+        if self._base_interval != interval:
+            _LOGGER.warning(f"Scan interval {interval}sec is out of options range "
+                            f"{self._min_interval}-{self._max_interval}sec, polling every {self._base_interval}sec")
+        self._interval = self._base_interval
+        self._fast_until = 0.0
+
+    @property
+    def min_interval(self) -> float:
+        return self._min_interval
+
+    @property
+    def max_interval(self) -> float:
+        return self._max_interval
+
+    def notify_command(self) -> None:
+        """Start fast polling window, because device state is about to change."""
+        self._fast_until = monotonic() + FAST_POLL_WINDOW
+
+    def next_interval(self, old_values: dict | None, new_values: dict) -> timedelta:
+        """Return interval until the next poll based on how data changed since the previous one."""
+        if old_values is not None and self._co2_jump(old_values, new_values):
+            _LOGGER.debug("Large CO2 change, polling fast")
+            self.notify_command()
+
+        if monotonic() < self._fast_until:
+            self._interval = self._min_interval
+        elif old_values is not None and old_values == new_values:
+            self._interval = min(max(self._interval, self._base_interval) * POLL_BACKOFF_FACTOR, self._max_interval)
+        else:
+            self._interval = self._base_interval
+
+        jitter = random.uniform(-POLL_JITTER, POLL_JITTER) * self._interval
+        interval = min(max(self._interval + jitter, self._min_interval), self._max_interval)
+        if self._planner is not None:
+            interval = self._planner.plan(self._entry_id, interval, urgent=monotonic() < self._fast_until,
+                                          min_interval=self._min_interval)
+        return timedelta(seconds=interval)
+
+    def retry_interval(self, retry_in: float) -> timedelta:
+        """Return interval until the next poll after a failed one."""
+        return timedelta(seconds=max(retry_in, self._min_interval))
+
+    @staticmethod
+    def _co2_jump(old_values: dict, new_values: dict) -> bool:
+        for guid, record in new_values.items():
+            co2 = getattr(record, "co2", None)
+            old_co2 = getattr(old_values.get(guid), "co2", None)
+            if co2 is not None and old_co2 is not None and abs(co2 - old_co2) >= CO2_CHANGE_THRESHOLD:
+                return True
+        return False
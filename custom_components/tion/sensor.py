@@ -1,149 +1,389 @@
 """Platform for sensor integration."""
 import logging
+import math
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.components.sensor import ATTR_STATE_CLASS as STATE_CLASS
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.components.sensor import (
+    DOMAIN as SENSOR_DOMAIN,
     SensorDeviceClass,
     SensorStateClass,
     SensorEntity,
+    SensorEntityDescription,
 )
-from homeassistant.const import UnitOfTemperature, STATE_UNKNOWN, STATE_ON, STATE_OFF
+from homeassistant.const import UnitOfTemperature, UnitOfTime, EntityCategory, STATE_ON, STATE_OFF
+from homeassistant.helpers.typing import StateType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import DOMAIN
-from tion import (
-    Breezer,
-    MagicAir,
-    TionApi
+from .const import (
+    DOMAIN,
+    BREEZER_DEVICE,
+    MAGICAIR_DEVICE,
+    CONF_CO2_DEADBAND,
+    CONF_TEMPERATURE_DEADBAND,
+    CONF_HUMIDITY_DEADBAND,
+    CONF_MAX_SILENCE,
+    CONF_STATISTICS_ONLY,
+    DEFAULT_CO2_DEADBAND,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DEFAULT_HUMIDITY_DEADBAND,
+    DEFAULT_MAX_SILENCE,
+    DEFAULT_STATISTICS_ONLY,
+    ROLLING_WINDOWS,
 )
+from .coordinator import TionDataUpdateCoordinator
+from .entity import TionEntity
+from .models import BreezerState, MagicAirState
+from .rolling import TionRollingWindow
 
 _LOGGER = logging.getLogger(__name__)
 
 from . import TION_API
 
-# Sensor types
-CO2_SENSOR = {
-    "name": "co2",
-    "native_unit_of_measurement": "ppm",
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "device_class": SensorDeviceClass.CO2,
-    "suggested_display_precision": 0,
-}
-TEMP_SENSOR = {
-    "name": "temperature",
-    "native_unit_of_measurement": UnitOfTemperature.CELSIUS,
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "device_class": SensorDeviceClass.TEMPERATURE,
-    "suggested_display_precision": 0,
-}
-HUM_SENSOR = {
-    "name": "humidity",
-    "native_unit_of_measurement": "%",
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "device_class": SensorDeviceClass.HUMIDITY,
-    "suggested_display_precision": 0,
-}
-TEMP_IN_SENSOR = {
-    "name": "temperature in",
-    "native_unit_of_measurement": UnitOfTemperature.CELSIUS,
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "device_class": SensorDeviceClass.TEMPERATURE,
-    "suggested_display_precision": 0,
-}
-TEMP_OUT_SENSOR = {
-    "name": "temperature out",
-    "native_unit_of_measurement": UnitOfTemperature.CELSIUS,
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "device_class": SensorDeviceClass.TEMPERATURE,
-    "suggested_display_precision": 0,
-}
-SPEED_SENSOR = {
-    "name": "speed",
-    STATE_CLASS: SensorStateClass.MEASUREMENT,
-    "suggested_display_precision": 0,
-}
-FAN_STATE_SENSOR = {
-    "name": "fan state",
-}
+
+@dataclass(frozen=True, kw_only=True)
+class TionSensorEntityDescription(SensorEntityDescription):
+    """Sensor of a Tion device field."""
+
+    device_types: tuple[str, ...]
+    value_fn: Callable[[BreezerState | MagicAirState], StateType]
+    deadband_option: str | None = None  # option with the change, which is not worth a state write
+    deadband_default: float = 0
+    rolling_field: str | None = None  # record field with rolling statistics
+
+
+@dataclass(frozen=True, kw_only=True)
+class TionRollingSensorEntityDescription(SensorEntityDescription):
+    """Rolling statistic of a Tion device field, computed in memory."""
+
+    device_types: tuple[str, ...]
+    field: str
+    window: float
+    stat_fn: Callable[[TionRollingWindow], float | None]
+    deadband_option: str | None = None
+    deadband_default: float = 0
+
+
+@dataclass(frozen=True, kw_only=True)
+class TionApiSensorEntityDescription(SensorEntityDescription):
+    """Diagnostic sensor of cloud call and poll statistics."""
+
+    value_fn: Callable[[TionDataUpdateCoordinator], StateType]
+
+
+# Sensor types, key is a part of unique id
+SENSOR_TYPES: tuple[TionSensorEntityDescription, ...] = (
+    TionSensorEntityDescription(
+        key="co2",
+        name="co2",
+        device_types=(MAGICAIR_DEVICE,),
+        value_fn=lambda device: device.co2,
+        native_unit_of_measurement="ppm",
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.CO2,
+        suggested_display_precision=0,
+        deadband_option=CONF_CO2_DEADBAND,
+        deadband_default=DEFAULT_CO2_DEADBAND,
+        rolling_field="co2",
+    ),
+    TionSensorEntityDescription(
+        key="temperature",
+        name="temperature",
+        device_types=(MAGICAIR_DEVICE,),
+        value_fn=lambda device: device.temperature,
+        native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.TEMPERATURE,
+        suggested_display_precision=0,
+        deadband_option=CONF_TEMPERATURE_DEADBAND,
+        deadband_default=DEFAULT_TEMPERATURE_DEADBAND,
+        rolling_field="temperature",
+    ),
+    TionSensorEntityDescription(
+        key="humidity",
+        name="humidity",
+        device_types=(MAGICAIR_DEVICE,),
+        value_fn=lambda device: device.humidity,
+        native_unit_of_measurement="%",
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.HUMIDITY,
+        suggested_display_precision=0,
+        deadband_option=CONF_HUMIDITY_DEADBAND,
+        deadband_default=DEFAULT_HUMIDITY_DEADBAND,
+        rolling_field="humidity",
+    ),
+    TionSensorEntityDescription(
+        key="temperature in",
+        name="temperature in",
+        device_types=(BREEZER_DEVICE,),
+        value_fn=lambda device: device.t_in,
+        native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.TEMPERATURE,
+        suggested_display_precision=0,
+        deadband_option=CONF_TEMPERATURE_DEADBAND,
+        deadband_default=DEFAULT_TEMPERATURE_DEADBAND,
+        rolling_field="t_in",
+    ),
+    TionSensorEntityDescription(
+        key="temperature out",
+        name="temperature out",
+        device_types=(BREEZER_DEVICE,),
+        value_fn=lambda device: device.t_out,
+        native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.TEMPERATURE,
+        suggested_display_precision=0,
+        deadband_option=CONF_TEMPERATURE_DEADBAND,
+        deadband_default=DEFAULT_TEMPERATURE_DEADBAND,
+        rolling_field="t_out",
+    ),
+    TionSensorEntityDescription(
+        key="speed",
+        name="speed",
+        device_types=(BREEZER_DEVICE,),
+        value_fn=lambda device: device.speed,
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=0,
+    ),
+    TionSensorEntityDescription(
+        key="fan state",
+        name="fan state",
+        device_types=(BREEZER_DEVICE,),
+        value_fn=lambda device: STATE_ON if device.speed > 0 else STATE_OFF,
+    ),
+)
+
+# Statistics of every rolling window: name, value, is it a change per hour
+ROLLING_STATS = (
+    ("mean", lambda window: window.mean, False),
+    ("max", lambda window: window.max, False),
+    ("rate", lambda window: window.rate, True),
+)
+
+
+def _rolling_sensor_types() -> tuple[TionRollingSensorEntityDescription, ...]:
+    """Return statistics sensor types of sensor types with rolling statistics."""
+    descriptions = []
+    for source in SENSOR_TYPES:
+        if source.rolling_field is None:
+            continue
+        for window in ROLLING_WINDOWS:
+            period = f"{window // 3600}h" if window % 3600 == 0 else f"{window // 60}m"
+            for stat, stat_fn, rate in ROLLING_STATS:
+                descriptions.append(TionRollingSensorEntityDescription(
+                    key=f"{source.key} {stat} {period}",
+                    name=f"{source.name} {stat} {period}",
+                    device_types=source.device_types,
+                    field=source.rolling_field,
+                    window=window,
+                    stat_fn=stat_fn,
+                    native_unit_of_measurement=f"{source.native_unit_of_measurement}/h" if rate
+                    else source.native_unit_of_measurement,
+                    device_class=None if rate else source.device_class,
+                    state_class=SensorStateClass.MEASUREMENT,
+                    suggested_display_precision=source.suggested_display_precision,
+                    deadband_option=None if rate else source.deadband_option,
+                    deadband_default=0 if rate else source.deadband_default,
+                    entity_registry_enabled_default=source.key == "co2" and not rate,  # rate is noisy
+                ))
+    return tuple(descriptions)
+
+
+ROLLING_SENSOR_TYPES = _rolling_sensor_types()
+
+# Cloud connection diagnostic sensor types
+API_SENSOR_TYPES: tuple[TionApiSensorEntityDescription, ...] = (
+    TionApiSensorEntityDescription(
+        key="latency_p50",
+        name="api latency p50",
+        value_fn=lambda coordinator: coordinator.client.stats.latency_p50,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.DURATION,
+        suggested_display_precision=0,
+    ),
+    TionApiSensorEntityDescription(
+        key="latency_p95",
+        name="api latency p95",
+        value_fn=lambda coordinator: coordinator.client.stats.latency_p95,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.DURATION,
+        suggested_display_precision=0,
+    ),
+    TionApiSensorEntityDescription(
+        key="requests_per_minute",
+        name="api requests per minute",
+        value_fn=lambda coordinator: coordinator.client.stats.requests_per_minute,
+        native_unit_of_measurement="req/min",
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    TionApiSensorEntityDescription(
+        key="errors",
+        name="api errors",
+        value_fn=lambda coordinator: coordinator.client.stats.errors,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+    ),
+    TionApiSensorEntityDescription(
+        key="retries",
+        name="api retries",
+        value_fn=lambda coordinator: coordinator.client.stats.retries,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+    ),
+    TionApiSensorEntityDescription(
+        key="skipped_polls",
+        name="skipped polls",
+        value_fn=lambda coordinator: coordinator.skipped_polls,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+    ),
+)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities) -> bool:
-    tion = hass.data[TION_API][entry.entry_id]
-
-    entities = []
-    devices = await hass.async_add_executor_job(tion.get_devices)
-    for device in devices:
-        if device.valid:
-            if type(device) == MagicAir:
-                entities.append(TionSensor(tion, device.guid, CO2_SENSOR))
-                entities.append(TionSensor(tion, device.guid, TEMP_SENSOR))
-                entities.append(TionSensor(tion, device.guid, HUM_SENSOR))
-            elif type(device) == Breezer:
-                entities.append(TionSensor(tion, device.guid, TEMP_IN_SENSOR))
-                entities.append(TionSensor(tion, device.guid, TEMP_OUT_SENSOR))
-                entities.append(TionSensor(tion, device.guid, SPEED_SENSOR))
-                entities.append(TionSensor(tion, device.guid, FAN_STATE_SENSOR))
-        else:
-            _LOGGER.info(f"Skipped device {device}, because of 'valid' property")
-
-    async_add_entities(entities)
+    coordinator: TionDataUpdateCoordinator = hass.data[TION_API][entry.entry_id]
+
+    max_silence = entry.options.get(CONF_MAX_SILENCE, DEFAULT_MAX_SILENCE)
+    statistics_only = entry.options.get(CONF_STATISTICS_ONLY, DEFAULT_STATISTICS_ONLY)
+    known = coordinator.known(SENSOR_DOMAIN)
+    skipped = set()
+
+    def _deadband(description: TionSensorEntityDescription | TionRollingSensorEntityDescription) -> float:
+        if statistics_only and (isinstance(description, TionRollingSensorEntityDescription)
+                                or description.rolling_field is not None):
+            return math.inf  # measurements are written once per max_silence, the history is kept by statistics
+        return entry.options.get(description.deadband_option, description.deadband_default)
+
+    @callback
+    def _async_add_new_devices() -> None:
+        """Add sensors of devices, which appeared since the previous poll."""
+        snapshot = coordinator.data
+        entities = []
+        for device_type, guids in snapshot.by_type.items():
+            for guid in guids:
+                if guid in known:
+                    continue
+                if not snapshot.devices[guid].valid:
+                    if guid not in skipped:
+                        skipped.add(guid)
+                        _LOGGER.info(f"Skipped device {snapshot.devices[guid]}, because of 'valid' property")
+                    continue
+                known.add(guid)
+                entities.extend(
+                    TionSensor(coordinator, guid, description, _deadband(description), max_silence)
+                    for description in SENSOR_TYPES if device_type in description.device_types)
+                entities.extend(
+                    TionRollingSensor(coordinator, guid, description, _deadband(description), max_silence)
+                    for description in ROLLING_SENSOR_TYPES if device_type in description.device_types)
+        if entities:
+            async_add_entities(entities)
+
+    _async_add_new_devices()
+    entry.async_on_unload(coordinator.async_add_listener(_async_add_new_devices))
+
+    async_add_entities(TionApiSensor(coordinator, entry, description) for description in API_SENSOR_TYPES)
+
     return True
 
 
-class TionSensor(SensorEntity):
+class TionSensor(TionEntity, SensorEntity):
     """Representation of a Sensor."""
 
-    def __init__(self, tion: TionApi, guid, sensor_type):
-        self._device = tion.get_devices(guid=guid)[0]
-        self._sensor_type = sensor_type
-        if sensor_type.get(STATE_CLASS, None) is not None:
-            self._attr_state_class = sensor_type[STATE_CLASS]
-        if sensor_type.get('device_class', None) is not None:
-            self._attr_device_class = sensor_type['device_class']
-        if sensor_type.get('native_unit_of_measurement', None) is not None:
-            self._attr_native_unit_of_measurement = sensor_type['native_unit_of_measurement']
-        if sensor_type.get('suggested_display_precision', None) is not None:
-            self._attr_suggested_display_precision = sensor_type['suggested_display_precision']
+    _unrecorded_attributes = frozenset({"stale"})
 
-    @property
-    def device_info(self):
-        return {
-            "identifiers": {(DOMAIN, self._device.guid)},
+    entity_description: TionSensorEntityDescription
+
+    def __init__(self, coordinator: TionDataUpdateCoordinator, guid, description: TionSensorEntityDescription,
+                 deadband: float, max_silence: float):
+        super().__init__(coordinator, max_silence)
+        self._guid = guid
+        self._deadband = deadband
+        self.entity_description = description
+        self._attr_unique_id = guid + description.key
+        self._attr_name = f"{self._device.name} {description.name}"
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, guid)},
         }
 
     @property
-    def unique_id(self):
-        """Return a unique id identifying the entity."""
-        return self._device.guid + self._sensor_type["name"]
+    def _device(self):
+        return self.coordinator.data.devices[self._guid]
 
     @property
-    def name(self):
-        """Return the name of the sensor."""
-        return f"{self._device.name} {self._sensor_type['name']}"
+    def native_value(self):
+        """Return the state of the sensor."""
+        device = self._device
+        return self.entity_description.value_fn(device) if device.valid else None
+
+    def _values(self):
+        return self.native_value
+
+    def _records(self) -> tuple:
+        return (self.coordinator.data.devices.get(self._guid),)
+
+    def _unchanged(self, published, values) -> bool:
+        if isinstance(published, (int, float)) and isinstance(values, (int, float)):
+            return abs(values - published) < self._deadband or values == published
+        return published == values
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Mark the value as stale while the cloud is failing."""
+        return {"stale": self.coordinator.stale}
+
+    @property
+    def available(self) -> bool:
+        """Return True if entity is available."""
+        return super().available and self._guid in self.coordinator.data.devices
+
+
+class TionRollingSensor(TionSensor):
+    """Mean, max or rate of change of a device value over a rolling window, without database queries."""
+
+    def _records(self) -> None:
+        return None  # the window changes on every poll
+
+    entity_description: TionRollingSensorEntityDescription
+
+    @property
+    def native_value(self):
+        """Return the statistic of polled values."""
+        description = self.entity_description
+        window = self.coordinator.statistics.window(self._guid, description.field, description.window)
+        if window is None or not self._device.valid:
+            return None
+        window.expire(monotonic())  # the device may not have been polled for a while
+        value = description.stat_fn(window)
+        return round(value, 1) if value is not None else None
+
+
+class TionApiSensor(CoordinatorEntity[TionDataUpdateCoordinator], SensorEntity):
+    """Diagnostic sensor of the cloud connection."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    entity_description: TionApiSensorEntityDescription
+
+    def __init__(self, coordinator: TionDataUpdateCoordinator, entry: ConfigEntry,
+                 description: TionApiSensorEntityDescription):
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._attr_unique_id = f"{entry.entry_id}_{description.key}"
+        self._attr_name = f"Tion {entry.title} {description.name}"
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, entry.entry_id)},
+        }
 
     @property
     def native_value(self):
         """Return the state of the sensor."""
-        state = STATE_UNKNOWN
-        if self._sensor_type == CO2_SENSOR:
-            state = self._device.co2
-        elif self._sensor_type == TEMP_SENSOR:
-            state = self._device.temperature
-        elif self._sensor_type == HUM_SENSOR:
-            state = self._device.humidity
-        elif self._sensor_type == TEMP_IN_SENSOR:
-            state = self._device.t_in
-        elif self._sensor_type == TEMP_OUT_SENSOR:
-            state = self._device.t_out
-        elif self._sensor_type == SPEED_SENSOR:
-            state = self._device.speed
-        elif self._sensor_type == FAN_STATE_SENSOR:
-            state = STATE_ON if self._device.speed > 0 else STATE_OFF
-        return state if self._device.valid else STATE_UNKNOWN
-
-    def update(self):
-        """Fetch new state data for the sensor.
-        This is the only method that should fetch new data for Home Assistant.
-        """
-        self._device.load()
+        return self.entity_description.value_fn(self.coordinator)
+
+    @property
+    def available(self) -> bool:
+        """Statistics are available even when the cloud is not."""
+        return True
@@ -0,0 +1,160 @@
+"""Services of Tion integration"""
+import asyncio
+import logging
+
+import voluptuous as vol
+from homeassistant.components.climate import DOMAIN as CLIMATE_DOMAIN
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import config_validation as cv, entity_registry as er
+from homeassistant.helpers.service import async_extract_referenced_entity_ids
+
+from .api import TionApiError
+from .commands import QUEUED
+from .const import DOMAIN, TION_API, BREEZER_DEVICE
+from .coordinator import TionDataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_APPLY_PROFILE = "apply_profile"
+
+ATTR_ZONES = "zones"
+ATTR_MODE = "mode"
+ATTR_SPEED = "speed"
+ATTR_SPEED_MIN = "speed_min"
+ATTR_SPEED_MAX = "speed_max"
+ATTR_TARGET_CO2 = "target_co2"
+ATTR_HEATER = "heater"
+ATTR_GATE = "gate"
+
+APPLY_PROFILE_SCHEMA = vol.All(
+    vol.Schema({
+        **cv.ENTITY_SERVICE_FIELDS,
+        vol.Optional(ATTR_ZONES): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(ATTR_MODE): vol.In(["auto", "manual"]),
+        vol.Optional(ATTR_SPEED): vol.All(vol.Coerce(int), vol.Range(min=0, max=6)),
+        vol.Optional(ATTR_SPEED_MIN): vol.All(vol.Coerce(int), vol.Range(min=0, max=6)),
+        vol.Optional(ATTR_SPEED_MAX): vol.All(vol.Coerce(int), vol.Range(min=0, max=6)),
+        vol.Optional(ATTR_TARGET_CO2): vol.All(vol.Coerce(int), vol.Range(min=400, max=2000)),
+        vol.Optional(ATTR_HEATER): cv.boolean,
+        # 0 - inside, 1 - combined, 2 - outside (breezer4: 1 - inside, 0 - outside)
+        vol.Optional(ATTR_GATE): vol.All(vol.Coerce(int), vol.In([0, 1, 2])),
+    }),
+    cv.has_at_least_one_key(*cv.ENTITY_SERVICE_FIELDS, ATTR_ZONES),
+    cv.has_at_least_one_key(ATTR_MODE, ATTR_SPEED, ATTR_SPEED_MIN, ATTR_SPEED_MAX, ATTR_TARGET_CO2, ATTR_HEATER,
+                            ATTR_GATE),
+)
+
+
+def _profile_changes(call: ServiceCall) -> tuple[dict, dict]:
+    """Return zone and breezer fields to change."""
+    zone_changes = {}
+    if ATTR_MODE in call.data:
+        zone_changes["mode"] = call.data[ATTR_MODE]
+    if ATTR_TARGET_CO2 in call.data:
+        zone_changes["target_co2"] = call.data[ATTR_TARGET_CO2]
+    breezer_changes = {}
+    for attr, field in ((ATTR_SPEED, "speed"), (ATTR_SPEED_MIN, "speed_min_set"), (ATTR_SPEED_MAX, "speed_max_set"),
+                        (ATTR_HEATER, "heater_enabled"), (ATTR_GATE, "gate")):
+        if attr in call.data:
+            breezer_changes[field] = call.data[attr]
+    return zone_changes, breezer_changes
+
+
+def _resolve_breezers(hass: HomeAssistant, call: ServiceCall) -> dict[str, tuple[TionDataUpdateCoordinator, str]]:
+    """Return coordinator and guid of every breezer targeted by entities, devices, areas or zones by entity id."""
+    coordinators: dict[str, TionDataUpdateCoordinator] = hass.data.get(TION_API, {})
+    registry = er.async_get(hass)
+    breezers = {}
+
+    referenced = async_extract_referenced_entity_ids(hass, call)
+    for entity_id in referenced.referenced | referenced.indirectly_referenced:
+        entry = registry.async_get(entity_id)
+        if entry is None or entry.platform != DOMAIN or entry.domain != CLIMATE_DOMAIN:
+            continue
+        coordinator = coordinators.get(entry.config_entry_id)
+        if coordinator is not None and entry.unique_id in coordinator.data.devices:
+            breezers[entity_id] = (coordinator, entry.unique_id)
+
+    for zone in call.data.get(ATTR_ZONES, []):
+        found = False
+        for coordinator in coordinators.values():
+            snapshot = coordinator.data
+            for zone_guid, zone_state in snapshot.zones.items():
+                if zone in (zone_guid, zone_state.name):
+                    found = True
+                    for guid in snapshot.zone_members(zone_guid, BREEZER_DEVICE):
+                        entity_id = registry.async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, guid)
+                        if entity_id is not None:
+                            breezers[entity_id] = (coordinator, guid)
+        if not found:
+            raise ServiceValidationError(f"Tion zone {zone} is not found")
+
+    return breezers
+
+
+async def _async_apply_profile(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Send one zone command per zone and one breezer command per breezer, report result per entity."""
+    breezers = _resolve_breezers(hass, call)
+    if not breezers:
+        raise ServiceValidationError("No Tion breezers are targeted")
+    zone_changes, breezer_changes = _profile_changes(call)
+
+    zone_sends = {}
+    breezer_sends = {}
+    released = set()  # coordinators with zones released from local control
+    entity_zones = {}  # the breezer may be removed by a poll while its commands are sent
+    errors = {}
+    for entity_id, (coordinator, guid) in breezers.items():
+        breezer = coordinator.data.devices[guid]
+        if breezer_changes.get("heater_enabled") and not breezer.heater_installed:
+            errors[entity_id] = "heater is not installed"
+            continue
+        zone_key = entity_zones[entity_id] = (coordinator, breezer.zone_guid)
+        if zone_changes and zone_key not in zone_sends:
+            zone_sends[zone_key] = coordinator.commands.async_set_zone(breezer.zone_guid, **zone_changes)
+            if "mode" in zone_changes and coordinator.controller is not None:
+                coordinator.controller.async_release(breezer.zone_guid)  # the mode is set explicitly
+                released.add(coordinator)
+        if breezer_changes:
+            breezer_sends[entity_id] = coordinator.commands.async_set_breezer(guid, **breezer_changes)
+
+    # commands of all targets are collected by the queues and sent with bounded concurrency
+    zone_keys = list(zone_sends)
+    entity_ids = list(breezer_sends)
+    results = await asyncio.gather(*zone_sends.values(), *breezer_sends.values(), return_exceptions=True)
+    for coordinator in released:
+        coordinator.async_update_listeners()  # fan mode of released zones is not auto anymore
+    zone_results = dict(zip(zone_keys, results[:len(zone_keys)]))
+    breezer_results = dict(zip(entity_ids, results[len(zone_keys):]))
+
+    response = {}
+    for entity_id in breezers:
+        if entity_id in errors:
+            response[entity_id] = {"success": False, "queued": False, "error": errors[entity_id]}
+            continue
+        entity_results = [breezer_results.get(entity_id, True),
+                          zone_results.get(entity_zones[entity_id], True)]
+        error = next((result for result in entity_results if isinstance(result, Exception)), None)
+        if error is not None and not isinstance(error, TionApiError):
+            raise error
+        response[entity_id] = {
+            "success": all(result is True for result in entity_results),
+            "queued": any(result == QUEUED for result in entity_results),
+            "error": str(error) if error is not None else None,
+        }
+    failed = [entity_id for entity_id, result in response.items()
+              if not result["success"] and not result["queued"]]
+    if failed:
+        _LOGGER.warning(f"Profile is not applied to {', '.join(failed)}")
+    return {"results": response}
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register integration services."""
+
+    async def async_apply_profile(call: ServiceCall) -> ServiceResponse:
+        return await _async_apply_profile(hass, call)
+
+    hass.services.async_register(DOMAIN, SERVICE_APPLY_PROFILE, async_apply_profile, schema=APPLY_PROFILE_SCHEMA,
+                                 supports_response=SupportsResponse.OPTIONAL)
@@ -0,0 +1,84 @@
+"""Latency and throughput statistics of Tion cloud calls"""
+import math
+from collections import deque
+from time import monotonic, time
+
+RECENT_CALLS = 200
+HISTOGRAM_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class TionCallStats:
+    """Keep recent cloud calls and counters of one client."""
+
+    def __init__(self):
+        self.total = 0
+        self.errors = 0
+        self.retries = 0
+        self._calls = deque(maxlen=RECENT_CALLS)  # (wall time, endpoint, duration ms, ok)
+        self._last_minute = deque()
+
+    def record(self, endpoint: str, duration: float, ok: bool) -> None:
+        """Record finished call, duration is in seconds."""
+        now = monotonic()
+        self.total += 1
+        if not ok:
+            self.errors += 1
+        self._calls.append((time(), endpoint, duration * 1000, ok))
+        self._last_minute.append(now)
+        self._expire(now)
+
+    def record_retry(self) -> None:
+        self.retries += 1
+
+    def _expire(self, now: float) -> None:
+        while self._last_minute and now - self._last_minute[0] > 60:
+            self._last_minute.popleft()
+
+    def percentile(self, percent: float) -> float | None:
+        """Return latency percentile of recent calls in milliseconds."""
+        durations = sorted(call[2] for call in self._calls)
+        if not durations:
+            return None
+        index = max(math.ceil(len(durations) * percent / 100) - 1, 0)  # nearest rank
+        return round(durations[index], 1)
+
+    @property
+    def latency_p50(self) -> float | None:
+        return self.percentile(50)
+
+    @property
+    def latency_p95(self) -> float | None:
+        return self.percentile(95)
+
+    @property
+    def requests_per_minute(self) -> int:
+        self._expire(monotonic())
+        return len(self._last_minute)
+
+    def histogram(self) -> dict:
+        """Return count of recent calls per latency bucket."""
+        buckets = {f"<={limit}ms": 0 for limit in HISTOGRAM_BUCKETS_MS}
+        buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+        for _, _, duration, _ in self._calls:
+            for limit in HISTOGRAM_BUCKETS_MS:
+                if duration <= limit:
+                    buckets[f"<={limit}ms"] += 1
+                    break
+            else:
+                buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+        return buckets
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "errors": self.errors,
+            "retries": self.retries,
+            "requests_per_minute": self.requests_per_minute,
+            "latency_p50_ms": self.latency_p50,
+            "latency_p95_ms": self.latency_p95,
+            "histogram": self.histogram(),
+            "recent_calls": [
+                {"time": timestamp, "endpoint": endpoint, "duration_ms": round(duration, 1), "ok": ok}
+                for timestamp, endpoint, duration, ok in self._calls
+            ],
+        }
@@ -0,0 +1,59 @@
+"""Persistent cache of Tion zones and devices"""
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+STORAGE_VERSION = 1
+
+# device fields, which don't change between polls and are needed to create entities
+DEVICE_KEYS = ("guid", "name", "type", "firmware", "t_min", "t_max")
+DEVICE_DATA_KEYS = ("data_valid", "heater_installed", "speed_limit")
+
+
+def topology_of(locations: list[dict]) -> list[dict]:
+    """Return zones and devices of raw location data without measurements and settings.
+
+    The result has the same layout as the location data, so it is parsed the same way.
+    """
+    return [
+        {
+            "zones": [
+                {
+                    "guid": zone.get("guid"),
+                    "name": zone.get("name"),
+                    "devices": [
+                        {
+                            **{key: device.get(key) for key in DEVICE_KEYS if key in device},
+                            "data": {key: device["data"][key] for key in DEVICE_DATA_KEYS
+                                     if key in device.get("data", {})},
+                        }
+                        for device in zone.get("devices", [])
+                    ],
+                }
+                for zone in location.get("zones", [])
+            ],
+        }
+        for location in locations
+    ]
+
+
+class TionTopologyStore:
+    """Keep the last known zones and devices of a config entry in Home Assistant storage."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str):
+        self._store = Store(hass, STORAGE_VERSION, f"tion.{entry_id}.topology")
+        self._topology = None
+
+    async def async_load(self) -> list[dict] | None:
+        data = await self._store.async_load()
+        self._topology = data.get("locations") if data else None
+        return self._topology
+
+    async def async_update(self, locations: list[dict]) -> None:
+        """Save topology of freshly polled data, if it differs from the stored one."""
+        topology = topology_of(locations)
+        if topology != self._topology:
+            self._topology = topology
+            await self._store.async_save({"locations": topology})
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()